@@ -1,6 +1,8 @@
 from django.contrib import admin
+from django.db.models.expressions import RawSQL
 
 from .models import Group, Post, Comment, Follow, ProfilePhoto
+from .search import match_query, search_ids
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -9,6 +11,13 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ("pub_date",) 
     empty_value_display = "-пусто-"
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по полнотекстовому индексу вместо LIKE '%...%'.
+        if match_query(search_term) is None:
+            return queryset, False
+        sql, params = search_ids(search_term)
+        return queryset.filter(pk__in=RawSQL(sql, params)), False
+
 class GroupAdmin(admin.ModelAdmin):
     list_display = ("pk", "title", "description", "slug") 
     search_fields = ("title",) 
@@ -0,0 +1,237 @@
+"""
+JSON только для чтения: те же ленты, что в posts.views, без шаблонов.
+
+Ответы проверяются по ETag и Last-Modified, которые собираются из
+поколений кеша (posts.caching) без запросов к базе: клиент, который
+опрашивает ленту, получает 304, пока поколение не сменилось.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition, require_safe
+
+from .caching import comments_scope, generation, last_modified
+from .counters import user_stats
+from .middleware import query_budget
+from .lookups import get_post_or_404, resolve_username
+from .models import Group, Post
+from .paginator import paginate
+from .profiles import get_profile, header_scope
+from .thumbnails import prefetch_thumbnails, ready_thumbnails
+from .timeline import FEED_FIELD, FEED_KEY, timeline_sources
+
+
+def _scopes(request, kwargs, scopes):
+    # Имена поколений нужны и для ETag, и для Last-Modified: считаются
+    # один раз на запрос.
+    if not hasattr(request, 'api_scopes'):
+        request.api_scopes = scopes(request, **kwargs)
+    return request.api_scopes
+
+
+def conditional(scopes):
+    """
+    ETag и Last-Modified ответа по поколениям, которые возвращает
+    scopes(request, **kwargs). В ETag входят также адрес с курсором
+    и зритель.
+    """
+    def etag(request, *args, **kwargs):
+        names = _scopes(request, kwargs, scopes)
+        user = request.user
+        parts = [str(generation(name)) for name in names] + [
+            str(user.pk) if user.is_authenticated else 'anon',
+            request.get_full_path(),
+        ]
+        return hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+    def modified(request, *args, **kwargs):
+        return last_modified(*_scopes(request, kwargs, scopes))
+
+    return condition(etag_func=etag, last_modified_func=modified)
+
+
+def api_view(view):
+    """
+    Только GET и HEAD, 404 и 401 отдаются в JSON.
+    """
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            response = view(request, *args, **kwargs)
+        except Http404:
+            return JsonResponse({'detail': 'Not found.'}, status=404)
+        patch_vary_headers(response, ['Cookie'])
+        return response
+    return wrapper
+
+
+def login_required(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse(
+                {'detail': 'Authentication required.'}, status=401
+            )
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def _image(post):
+    if not post.image:
+        return None
+    batch = getattr(post, 'thumbnail_batch', None)
+    if batch is not None:
+        thumbnails = batch.get(post)
+    else:
+        thumbnails = ready_thumbnails(post.image, 'post')
+    return {
+        'url': post.image.url,
+        'width': post.image_width,
+        'height': post.image_height,
+        'color': post.image_color,
+        'thumbnail': thumbnails.src.url if thumbnails else None,
+        'srcset': thumbnails.srcset if thumbnails else '',
+    }
+
+
+def serialize_post(post):
+    return {
+        'id': post.pk,
+        'author': post.author.username,
+        'group': post.group.slug if post.group_id else None,
+        'text': post.text,
+        'pub_date': post.pub_date.isoformat(),
+        'comments': post.comment_count,
+        'image': _image(post),
+    }
+
+
+def serialize_comment(comment):
+    return {
+        'id': comment.pk,
+        'author': comment.author.username,
+        'text': comment.text,
+        'created': comment.created.isoformat(),
+    }
+
+
+def serialize_profile(profile):
+    stats = user_stats(profile)
+    return {
+        'username': profile.username,
+        'name': profile.get_full_name(),
+        'avatar': default_storage.url(
+            profile.avatar or settings.DEFAULT_AVATAR
+        ),
+        'avatar_color': profile.avatar_color,
+        'posts': stats.posts_count,
+        'followers': stats.followers_count,
+        'following': stats.following_count,
+        'is_followed': profile.is_followed,
+    }
+
+
+def _page(request, object_list, serialize, field='pub_date', key='pk',
+          **extra):
+    page, paginator = paginate(request, object_list, field, key)
+    if serialize is serialize_post:
+        prefetch_thumbnails(page)
+    extra.update(
+        results=[serialize(item) for item in page],
+        next=page.next_cursor(),
+        previous=page.previous_cursor(),
+    )
+    return JsonResponse(extra)
+
+
+def _profile_scopes(request, username, **kwargs):
+    # Шапка профиля меняется вместе со счётчиками и подписками.
+    return ['index', header_scope(resolve_username(username))]
+
+
+def _post_scopes(request, username, post_id):
+    # Запись показывает автора: поколение его шапки сменяется и при
+    # переименовании.
+    return ['index', header_scope(resolve_username(username))]
+
+
+def _comments_scopes(request, username, post_id):
+    return _post_scopes(request, username, post_id) + [
+        comments_scope(post_id)
+    ]
+
+
+def _follow_scopes(request):
+    # Лента меняется и когда зритель подписывается или отписывается.
+    if not request.user.is_authenticated:
+        return ['index']
+    return ['index', header_scope(request.user.pk)]
+
+
+@api_view
+@conditional(lambda request: ['index'])
+@query_budget(3)
+def index(request):
+    return _page(request, Post.objects.for_feed(), serialize_post)
+
+
+@api_view
+@conditional(lambda request, slug: ['index'])
+@query_budget(4)
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return _page(
+        request, group.posts.for_feed(), serialize_post,
+        group={
+            'slug': group.slug,
+            'title': group.title,
+            'description': group.description,
+        }
+    )
+
+
+@api_view
+@login_required
+@conditional(_follow_scopes)
+@query_budget(4)
+def follow_index(request):
+    return _page(
+        request, timeline_sources(request.user), serialize_post,
+        FEED_FIELD, FEED_KEY
+    )
+
+
+@api_view
+@conditional(_profile_scopes)
+@query_budget(5)
+def profile(request, username):
+    profile = get_profile(username, request.user)
+    return _page(
+        request, profile.posts.for_feed(), serialize_post,
+        profile=serialize_profile(profile)
+    )
+
+
+@api_view
+@conditional(_post_scopes)
+@query_budget(4)
+def post_view(request, username, post_id):
+    post = get_post_or_404(Post.objects.for_feed(), username, post_id)
+    return JsonResponse(serialize_post(post))
+
+
+@api_view
+@conditional(_comments_scopes)
+@query_budget(5)
+def comments(request, username, post_id):
+    post = get_post_or_404(Post.objects.all(), username, post_id)
+    return _page(
+        request, post.comments.select_related('author'), serialize_comment,
+        field='created'
+    )
@@ -0,0 +1,269 @@
+"""
+Подсказки имён пользователей и адресов сообществ по началу строки.
+
+Каждый процесс держит в памяти отсортированный список ключей
+(имя в нижнем регистре, вид, id) и ищет в нём префикс двоичным поиском.
+Изменения не перестраивают индекс: сигналы пишут их в общий журнал в
+кеше, а процесс при очередном запросе догоняет журнал по номеру. Если
+в журнале дыра (запись вытеснена, кеш очищен), индекс строится заново.
+
+В журнал попадают только появление, переименование и удаление, а счёт
+(подписчики, записи) меняется слишком часто и обновляется при полной
+пересборке раз в AUTOCOMPLETE_REBUILD_INTERVAL. Пересборка идёт вне
+_lock, так что поиск тем временем отвечает по старому индексу.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Group, User
+
+SEQUENCE_KEY = 'autocomplete:sequence'
+# Сколько живут записи журнала и сколько их можно догнать за раз.
+LOG_TIMEOUT = 60 * 60
+REPLAY_LIMIT = 500
+# До какой длины префикса индекс держит лучшие по счёту ключи.
+TOP_PREFIX_LENGTH = 2
+
+_index = None
+_lock = threading.Lock()
+_building = threading.Lock()
+
+
+def _change_key(number):
+    return 'autocomplete:change:{}'.format(number)
+
+
+def _new_sequence():
+    # Как у поколений кеша: после потери ключа счёт не совпадёт
+    # со старыми номерами.
+    return int(time.time() * 1000)
+
+
+def _user_label(username, first_name, last_name):
+    return ' '.join(filter(None, (first_name, last_name))) or username
+
+
+class PrefixIndex:
+    """
+    Отсортированный список ключей и счёт (подписчики пользователя,
+    записи сообщества), по которому ранжируются совпадения.
+
+    У коротких префиксов (до TOP_PREFIX_LENGTH символов) совпадений
+    слишком много, чтобы ранжировать все, поэтому для них индекс держит
+    top_size лучших по счёту ключей.
+    """
+
+    def __init__(self, entries, sequence, top_size=10):
+        self.sequence = sequence
+        self.built = time.time()
+        self._entries = {}
+        self._scores = {}
+        for kind, pk, name, label, score in entries:
+            self._entries[kind, pk] = ((name.lower(), kind, pk), name, label)
+            self._scores[kind, pk] = score
+        self._keys = sorted(key for key, _, _ in self._entries.values())
+        self._top_size = top_size
+        self._top = {}
+        for key in self._keys:
+            for prefix in self._prefixes(key):
+                self._top.setdefault(prefix, []).append(key)
+        for prefix, keys in self._top.items():
+            self._top[prefix] = heapq.nsmallest(
+                top_size, keys, key=self._rank
+            )
+
+    def __len__(self):
+        return len(self._keys)
+
+    @staticmethod
+    def _prefixes(key):
+        return {
+            key[0][:length] for length in range(1, TOP_PREFIX_LENGTH + 1)
+        }
+
+    def _rank(self, key):
+        return -self._scores[key[1], key[2]], key[0]
+
+    def _matching(self, prefix, scan=None):
+        # Ключи, начинающиеся с prefix, по алфавиту; не больше scan.
+        position = bisect_left(self._keys, (prefix,))
+        end = len(self._keys)
+        if scan is not None:
+            end = min(end, position + scan)
+        while position < end and self._keys[position][0].startswith(prefix):
+            yield self._keys[position]
+            position += 1
+
+    def upsert(self, kind, pk, name, label):
+        key = (name.lower(), kind, pk)
+        entry = self._entries.get((kind, pk))
+        if entry is not None and entry[0] == key:
+            self._entries[kind, pk] = (key, name, label)
+            return
+        self.remove(kind, pk, keep_score=True)
+        self._entries[kind, pk] = (key, name, label)
+        self._scores.setdefault((kind, pk), 0)
+        insort(self._keys, key)
+        for prefix in self._prefixes(key):
+            top = self._top.setdefault(prefix, [])
+            top.append(key)
+            top.sort(key=self._rank)
+            del top[self._top_size:]
+
+    def remove(self, kind, pk, keep_score=False):
+        entry = self._entries.pop((kind, pk), None)
+        if entry is None:
+            if not keep_score:
+                self._scores.pop((kind, pk), None)
+            return
+        position = bisect_left(self._keys, entry[0])
+        if position < len(self._keys) and self._keys[position] == entry[0]:
+            del self._keys[position]
+        for prefix in self._prefixes(entry[0]):
+            if entry[0] in self._top.get(prefix, ()):
+                # Освободившееся место занимает следующий по счёту.
+                self._top[prefix] = heapq.nsmallest(
+                    self._top_size, self._matching(prefix), key=self._rank
+                )
+        if not keep_score:
+            self._scores.pop((kind, pk), None)
+
+    def apply(self, change):
+        action, *args = change
+        getattr(self, action)(*args)
+
+    def lookup(self, prefix, limit, scan):
+        """
+        До limit совпадений с наибольшим счётом среди первых scan
+        ключей, начинающихся с prefix, и лучших ключей его начала.
+        """
+        prefix = prefix.lower()
+        if not prefix:
+            return []
+        matches = set(self._matching(prefix, scan))
+        matches.update(
+            key for key in self._top.get(prefix[:TOP_PREFIX_LENGTH], ())
+            if key[0].startswith(prefix)
+        )
+        best = heapq.nsmallest(limit, matches, key=self._rank)
+        return [
+            {
+                'type': kind,
+                'value': self._entries[kind, pk][1],
+                'label': self._entries[kind, pk][2],
+                'score': self._scores[kind, pk],
+            }
+            for _, kind, pk in best
+        ]
+
+
+def _entries():
+    users = User.objects.filter(is_active=True).values_list(
+        'pk', 'username', 'first_name', 'last_name', 'stats__followers_count'
+    )
+    for pk, username, first_name, last_name, followers in users.iterator():
+        yield (
+            'user', pk, username,
+            _user_label(username, first_name, last_name), followers or 0
+        )
+    groups = Group.objects.annotate(
+        posts_count=Count('posts')
+    ).values_list('pk', 'slug', 'title', 'posts_count')
+    for pk, slug, title, posts_count in groups.iterator():
+        yield 'group', pk, slug, title, posts_count
+
+
+def build_index():
+    # Номер берётся до чтения базы: изменения, пришедшие во время
+    # сборки, будут догнаны по журналу. Изменение, которое уже попало
+    # в базу, при этом применится повторно, поэтому в журнале только
+    # действия, которые можно повторять.
+    sequence = cache.get_or_set(SEQUENCE_KEY, _new_sequence, None)
+    return PrefixIndex(_entries(), sequence, settings.AUTOCOMPLETE_LIMIT)
+
+
+def _catch_up(index, sequence):
+    # Догоняет журнал; False, если журнал не дочитать.
+    gap = sequence - index.sequence
+    if gap < 0 or gap > REPLAY_LIMIT:
+        return False
+    numbers = range(index.sequence + 1, sequence + 1)
+    changes = cache.get_many([_change_key(number) for number in numbers])
+    if len(changes) != gap:
+        return False
+    for number in numbers:
+        index.apply(changes[_change_key(number)])
+    index.sequence = sequence
+    return True
+
+
+def get_index():
+    """
+    Индекс процесса, догнавший общий журнал изменений.
+    """
+    global _index
+    sequence = cache.get(SEQUENCE_KEY)
+    with _lock:
+        index = _index
+        fresh = index is not None and sequence is not None and (
+            time.time() - index.built < settings.AUTOCOMPLETE_REBUILD_INTERVAL
+        )
+        if fresh and (
+            sequence == index.sequence or _catch_up(index, sequence)
+        ):
+            return index
+    if index is not None and not _building.acquire(blocking=False):
+        # Индекс уже пересобирает другой поток.
+        return index
+    if index is None:
+        _building.acquire()
+    try:
+        with _lock:
+            if _index is not index:
+                return _index
+        built = build_index()
+        with _lock:
+            _index = built
+        return built
+    finally:
+        _building.release()
+
+
+def suggest(prefix, limit=None):
+    limit = limit or settings.AUTOCOMPLETE_LIMIT
+    index = get_index()
+    with _lock:
+        return index.lookup(prefix, limit, settings.AUTOCOMPLETE_SCAN_LIMIT)
+
+
+def _record(*change):
+    try:
+        number = cache.incr(SEQUENCE_KEY)
+    except ValueError:
+        # Номера нет: все процессы и так построят индекс заново.
+        return
+    cache.set(_change_key(number), change, LOG_TIMEOUT)
+
+
+def user_changed(user):
+    if user.is_active:
+        _record(
+            'upsert', 'user', user.pk, user.username,
+            _user_label(user.username, user.first_name, user.last_name)
+        )
+    else:
+        _record('remove', 'user', user.pk)
+
+
+def group_changed(group):
+    _record('upsert', 'group', group.pk, group.slug, group.title)
+
+
+def forget(kind, pk):
+    _record('remove', kind, pk)
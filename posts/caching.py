@@ -0,0 +1,228 @@
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.core.cache import cache
+from django.http import HttpResponse
+
+
+# Сколько секунд держится блокировка пересборки записи.
+LOCK_TIMEOUT = 10
+# Сколько секунд запрос ждёт чужую пересборку, если старой копии нет.
+WAIT_TIMEOUT = 2
+WAIT_INTERVAL = 0.05
+# Коэффициент раннего обновления: чем больше, тем раньше пересборка.
+EARLY_REFRESH_BETA = 1.0
+# Счётчики попаданий копятся в памяти процесса и переносятся в кеш
+# не чаще раза в STATS_FLUSH_INTERVAL секунд.
+STATS_FLUSH_INTERVAL = 10
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+_stats_flushed = time.monotonic()
+
+
+def _generation_key(name):
+    return 'generation:{}'.format(name)
+
+
+def _modified_key(name):
+    return 'generation_modified:{}'.format(name)
+
+
+def _new_generation():
+    # Если ключ поколения вытеснен из кеша, счёт начинается с текущего
+    # времени, чтобы не совпасть со старыми страницами.
+    return int(time.time() * 1000)
+
+
+def comments_scope(post_id):
+    """
+    Имя поколения комментариев записи, сменяется сигналами при
+    добавлении и удалении комментария.
+    """
+    return 'comments:{}'.format(post_id)
+
+
+def generation(name):
+    return cache.get_or_set(_generation_key(name), _new_generation, None)
+
+
+def bump_generation(name):
+    """
+    Делает недействительными все страницы, закешированные под именем name.
+    """
+    try:
+        cache.incr(_generation_key(name))
+    except ValueError:
+        cache.set(_generation_key(name), _new_generation(), None)
+    cache.set(_modified_key(name), time.time(), None)
+
+
+def last_modified(*names):
+    """
+    Когда в последний раз сменилось одно из поколений names. Для
+    поколения без отметки (вытеснена из кеша) отметкой становится
+    текущее время.
+    """
+    keys = [_modified_key(name) for name in names]
+    found = cache.get_many(keys)
+    missing = {key: time.time() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return datetime.fromtimestamp(max(found.values()), timezone.utc)
+
+
+def _stats_key(name, outcome):
+    return 'page_cache:{}:{}'.format(name, outcome)
+
+
+def flush_page_cache_stats():
+    """
+    Переносит накопленные в процессе счётчики в кеш.
+    """
+    global _stats_flushed
+    with _stats_lock:
+        pending = dict(_stats)
+        _stats.clear()
+        _stats_flushed = time.monotonic()
+    for key, amount in pending.items():
+        if not cache.add(key, amount, None):
+            try:
+                cache.incr(key, amount)
+            except ValueError:
+                cache.set(key, amount, None)
+
+
+def _count(name, outcome):
+    with _stats_lock:
+        _stats[_stats_key(name, outcome)] += 1
+        due = time.monotonic() - _stats_flushed >= STATS_FLUSH_INTERVAL
+    if due:
+        flush_page_cache_stats()
+
+
+def page_cache_stats(name):
+    flush_page_cache_stats()
+    return {
+        outcome: cache.get(_stats_key(name, outcome), 0)
+        for outcome in ('hits', 'misses')
+    }
+
+
+def page_key(name, request):
+    """
+    Ключ страницы: поколение, зритель (аноним или id пользователя) и адрес.
+    """
+    user = request.user
+    viewer = user.pk if user.is_authenticated else 'anon'
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return 'page:{}:{}:{}:{}'.format(name, generation(name), viewer, path)
+
+
+class Uncacheable(Exception):
+    """
+    Сборщик сообщает, что результат нельзя класть в кеш.
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+
+def _expiring(expires, delta, now):
+    # Вероятностное раннее обновление (XFetch): чем дольше сборка и чем
+    # ближе срок, тем вероятнее, что запрос пересоберёт запись заранее.
+    early = -delta * EARLY_REFRESH_BETA * math.log(1 - random.random())
+    return now + early >= expires
+
+
+def _build(key, build, timeout):
+    started = time.time()
+    value = build()
+    delta = time.time() - started
+    # Запись живёт в кеше дважды дольше срока, чтобы после истечения
+    # её старую копию можно было отдать, пока идёт пересборка.
+    cache.set(key, (value, started + timeout, delta), timeout * 2)
+    return value
+
+
+def get_or_build(key, build, timeout):
+    """
+    Возвращает значение из кеша, пересобирая его не более чем одним
+    обработчиком одновременно. Остальные получают старую копию, а если
+    её нет, недолго ждут готового значения.
+    """
+    lock = 'lock:{}'.format(key)
+    entry = cache.get(key)
+    if entry is not None:
+        value, expires, delta = entry
+        if not _expiring(expires, delta, time.time()):
+            return value
+        if not cache.add(lock, 1, LOCK_TIMEOUT):
+            return value
+        try:
+            return _build(key, build, timeout)
+        finally:
+            cache.delete(lock)
+
+    if cache.add(lock, 1, LOCK_TIMEOUT):
+        try:
+            return _build(key, build, timeout)
+        finally:
+            cache.delete(lock)
+
+    deadline = time.time() + WAIT_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    return build()
+
+
+def cached_page(name, timeout):
+    """
+    Кеширует страницу до смены поколения name (bump_generation),
+    но не дольше timeout секунд.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            built = []
+
+            def build():
+                response = view(request, *args, **kwargs)
+                built.append(response)
+                if response.status_code != 200 or response.streaming:
+                    raise Uncacheable(response)
+                # Заголовки (Content-Type, Vary, Cache-Control и другие)
+                # отдаются из кеша вместе с телом.
+                return response.content, list(response.items())
+
+            try:
+                content, headers = get_or_build(
+                    page_key(name, request), build, timeout
+                )
+            except Uncacheable as error:
+                return error.value
+            if built:
+                _count(name, 'misses')
+                response = built[0]
+                response['X-Cache'] = 'MISS'
+                return response
+            _count(name, 'hits')
+            response = HttpResponse(content)
+            for header, value in headers:
+                response[header] = value
+            response['X-Cache'] = 'HIT'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.template.loader import render_to_string
+
+from .caching import get_or_build
+from .models import Post
+
+ACTIONS_MARKER = '<!-- post-actions -->'
+
+
+def card_key(post, lazy=False):
+    return 'post_card:{}:{}:{}'.format(
+        post.pk, post.version, 'lazy' if lazy else 'eager'
+    )
+
+
+def bump(post_id):
+    """
+    Новая версия делает закешированную карточку записи недействительной.
+    """
+    Post.objects.filter(pk=post_id).update(version=F('version') + 1)
+
+
+def bump_posts(**lookups):
+    """
+    Новая версия карточек всех записей под lookups: карточка показывает
+    имя автора и название сообщества.
+    """
+    Post.objects.filter(**lookups).update(version=F('version') + 1)
+
+
+def forget(post):
+    cache.delete_many([card_key(post), card_key(post, lazy=True)])
+
+
+def render_card(post, user=None, lazy=False):
+    """
+    Общая для всех зрителей часть карточки берётся из кеша, кнопки
+    автора подставляются в неё после. Карточки ниже первого экрана
+    (lazy) кешируются отдельно, с loading="lazy" у картинки.
+    """
+    html = get_or_build(
+        card_key(post, lazy),
+        lambda: render_to_string(
+            'posts/includes/post_card.html', {'post': post, 'lazy': lazy}
+        ),
+        settings.POST_CARD_TIMEOUT
+    )
+    actions = ''
+    if user is not None and user.pk == post.author_id:
+        actions = render_to_string(
+            'posts/includes/post_actions.html', {'post': post}
+        )
+    return html.replace(ACTIONS_MARKER, actions)
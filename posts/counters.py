@@ -0,0 +1,82 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, User, UserStats
+
+
+def _shift_stats(user_id, field, delta):
+    UserStats.objects.filter(user=user_id).update(**{field: F(field) + delta})
+
+
+def user_stats(user):
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return UserStats.objects.get_or_create(user=user)[0]
+
+
+def post_added(post, delta=1):
+    _shift_stats(post.author_id, 'posts_count', delta)
+
+
+def comment_added(comment, delta=1):
+    # Число комментариев выводится в карточке, поэтому меняется и версия.
+    Post.objects.filter(pk=comment.post_id).update(
+        comment_count=F('comment_count') + delta,
+        version=F('version') + 1
+    )
+
+
+def follow_added(follow, delta=1):
+    _shift_stats(follow.author_id, 'followers_count', delta)
+    _shift_stats(follow.user_id, 'following_count', delta)
+
+
+def _count(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                **{field: OuterRef('pk')}
+            ).order_by().values(field).annotate(
+                total=Count('pk')
+            ).values('total')
+        ),
+        0
+    )
+
+
+def reconcile():
+    """
+    Пересчитывает все счётчики и возвращает число исправленных строк.
+    """
+    for user_id in User.objects.filter(
+        stats__isnull=True
+    ).values_list('pk', flat=True):
+        UserStats.objects.get_or_create(user_id=user_id)
+
+    fixed = 0
+    posts = Post.objects.annotate(actual=_count(Comment, 'post'))
+    for pk, actual in posts.exclude(
+        comment_count=F('actual')
+    ).values_list('pk', 'actual'):
+        fixed += Post.objects.filter(pk=pk).update(comment_count=actual)
+
+    users = User.objects.annotate(
+        actual_posts=_count(Post, 'author'),
+        actual_followers=_count(Follow, 'author'),
+        actual_following=_count(Follow, 'user'),
+    )
+    stale = users.exclude(
+        stats__posts_count=F('actual_posts'),
+        stats__followers_count=F('actual_followers'),
+        stats__following_count=F('actual_following'),
+    ).values_list(
+        'pk', 'actual_posts', 'actual_followers', 'actual_following'
+    )
+    for pk, posts_count, followers_count, following_count in stale:
+        fixed += UserStats.objects.filter(user=pk).update(
+            posts_count=posts_count,
+            followers_count=followers_count,
+            following_count=following_count,
+        )
+    return fixed
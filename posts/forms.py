@@ -2,12 +2,14 @@ from django import forms
 from django.forms import ModelForm, Textarea
 
 from .models import Post, Comment, ProfilePhoto
+from .uploads import ImageUploadField
 
 
 class PostForm(ModelForm):
     class Meta:
         model = Post
         fields = ['text', 'group', 'image']
+        field_classes = {'image': ImageUploadField}
         widgets = {
             'text': Textarea(attrs={'cols': 50, 'rows': 10}),
         }
@@ -24,3 +26,12 @@ class ProfilePhotoForm(ModelForm):
     class Meta:
         model = ProfilePhoto
         fields = ['photo']
+        field_classes = {'photo': ImageUploadField}
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField(max_length=200, label='Поиск')
+    group = forms.SlugField(required=False, widget=forms.HiddenInput)
+    author = forms.CharField(
+        max_length=150, required=False, widget=forms.HiddenInput
+    )
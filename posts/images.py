@@ -0,0 +1,45 @@
+from PIL import Image
+
+# Размер, до которого JPEG декодируется для подсчёта среднего цвета.
+DRAFT_SIZE = (64, 64)
+METADATA = ('width', 'height', 'size', 'color')
+
+
+def describe(file_):
+    """
+    Ширина, высота, размер в байтах и средний цвет (#rrggbb) изображения.
+    """
+    file_.seek(0)
+    with Image.open(file_) as image:
+        width, height = image.size
+        image.draft('RGB', DRAFT_SIZE)
+        red, green, blue = image.convert('RGB').resize(
+            (1, 1), Image.BOX
+        ).getpixel((0, 0))
+    file_.seek(0)
+    return {
+        'width': width,
+        'height': height,
+        'size': file_.size,
+        'color': '#{:02x}{:02x}{:02x}'.format(red, green, blue),
+    }
+
+
+def fill_metadata(instance, name):
+    """
+    Заполняет поля <name>_width, _height, _size, _color по только что
+    загруженному файлу поля name. Сохранённые файлы заново не читаются,
+    для старых записей есть команда fill_image_metadata.
+    """
+    file_ = getattr(instance, name)
+    if not file_:
+        values = dict.fromkeys(METADATA)
+    elif file_._committed:
+        return
+    else:
+        try:
+            values = describe(file_)
+        except OSError:
+            values = dict.fromkeys(METADATA)
+    for key, value in values.items():
+        setattr(instance, '{}_{}'.format(name, key), value)
@@ -0,0 +1,102 @@
+"""
+Имя пользователя из адреса превращается в id через кеш. Отсутствующие
+имена тоже кешируются, чтобы перебор случайных /<username>/ не доходил
+до базы. Кеш обновляется сигналами при сохранении, переименовании и
+удалении пользователя.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+
+from .models import User
+
+
+def _username_key(username):
+    # В адресе может быть что угодно, а ключ кеша должен быть коротким
+    # и без пробелов.
+    digest = hashlib.md5(username.encode()).hexdigest()
+    return 'username:{}'.format(digest)
+
+
+def remember_username(user):
+    cache.set(
+        _username_key(user.username), user.pk,
+        settings.USERNAME_CACHE_TIMEOUT
+    )
+
+
+def remember_missing(username):
+    cache.set(_username_key(username), 0, settings.USERNAME_MISS_TIMEOUT)
+
+
+def forget_username(username):
+    cache.delete(_username_key(username))
+
+
+def cached_user_id(username):
+    """
+    id пользователя username из кеша или None, если имени нет в кеше.
+    Для имени, которого нет и в базе, бросает Http404.
+    """
+    user_id = cache.get(_username_key(username))
+    if user_id == 0:
+        raise Http404('No user matches the given query.')
+    return user_id
+
+
+def resolve_username(username):
+    """
+    id пользователя username или Http404.
+    """
+    user_id = cached_user_id(username)
+    if user_id is None:
+        user = User.objects.filter(username=username).only('pk').first()
+        if user is None:
+            remember_missing(username)
+            raise Http404('No user matches the given query.')
+        user_id = user.pk
+        cache.set(
+            _username_key(username), user_id, settings.USERNAME_CACHE_TIMEOUT
+        )
+    return user_id
+
+
+def get_user_or_404(queryset, username):
+    """
+    Пользователь username из queryset. Если id известен, запрос идёт
+    по первичному ключу и сверяет имя, иначе id запоминается по итогам
+    того же запроса.
+    """
+    user_id = cached_user_id(username)
+    lookups = {'username': username}
+    if user_id is not None:
+        lookups['pk'] = user_id
+    user = queryset.filter(**lookups).first()
+    if user is None:
+        if user_id is None:
+            remember_missing(username)
+        else:
+            forget_username(username)
+        raise Http404('No user matches the given query.')
+    if user_id is None:
+        remember_username(user)
+    return user
+
+
+def get_post_or_404(queryset, username, post_id):
+    """
+    Запись post_id автора username вместе с автором одним запросом:
+    имя автора сверяется в том же запросе.
+    """
+    user_id = cached_user_id(username)
+    lookups = {'pk': post_id, 'author__username': username}
+    if user_id is not None:
+        lookups['author'] = user_id
+    post = queryset.filter(**lookups).select_related('author').first()
+    if post is None:
+        raise Http404('No post matches the given query.')
+    if user_id is None:
+        remember_username(post.author)
+    return post
@@ -0,0 +1,185 @@
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from posts.models import Post
+from yatube.sqlite.base import PRAGMAS, apply_pragmas
+
+# Режимы сравнения: PRAGMA соединения и живёт ли соединение между
+# "запросами" потока.
+MODES = (
+    ('default', {'journal_mode': 'DELETE'}, False),
+    ('tuned', PRAGMAS, True),
+)
+SEED_USERS = 50
+SEED_POSTS = 2000
+
+
+def _sql(queryset):
+    sql, params = queryset.query.sql_with_params()
+    return sql.replace('%s', '?'), params
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность SQLite без настроек и с '
+        'настройками yatube.sqlite на копии базы: потоки читают страницу '
+        'ленты и запись и добавляют комментарии.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument(
+            '--writes', type=float, default=0.2,
+            help='Доля операций записи.'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда поддерживает только SQLite.')
+        self.options = options
+        feed = Post.objects.for_feed().order_by('-pub_date', '-pk')[:10]
+        self.feed_sql, _ = _sql(feed)
+        # Вместо pk=0 при выполнении подставляется случайная запись.
+        self.post_sql, _ = _sql(
+            Post.objects.for_feed().filter(pk=0).order_by()
+        )
+        directory = tempfile.mkdtemp()
+        try:
+            for name, pragmas, persistent in MODES:
+                path = os.path.join(directory, name + '.sqlite3')
+                self.copy(path, pragmas)
+                result = self.run(path, pragmas, persistent)
+                self.report(name, result)
+        finally:
+            shutil.rmtree(directory)
+
+    def copy(self, path, pragmas):
+        target = sqlite3.connect(path)
+        connection.ensure_connection()
+        connection.connection.backup(target)
+        apply_pragmas(target, {'journal_mode': pragmas['journal_mode']})
+        if target.execute('SELECT COUNT(*) FROM posts_post').fetchone()[0]:
+            self.users = [row[0] for row in target.execute(
+                'SELECT id FROM auth_user'
+            )]
+        else:
+            self.seed(target)
+        self.posts = [row[0] for row in target.execute(
+            'SELECT id FROM posts_post'
+        )]
+        target.close()
+
+    def seed(self, target):
+        now = timezone.now().isoformat()
+        with target:
+            target.executemany(
+                'INSERT INTO auth_user (password, is_superuser, username, '
+                'first_name, last_name, email, is_staff, is_active, '
+                'date_joined) VALUES (?, 0, ?, ?, ?, ?, 0, 1, ?)',
+                [('!', 'bench{}'.format(i), '', '', '', now)
+                 for i in range(SEED_USERS)]
+            )
+            self.users = [row[0] for row in target.execute(
+                'SELECT id FROM auth_user'
+            )]
+            target.executemany(
+                'INSERT INTO posts_post (text, pub_date, author_id, image, '
+                'fanned_out, comment_count, version) '
+                'VALUES (?, ?, ?, "", 1, 0, 0)',
+                [('Text {}'.format(i), now, random.choice(self.users))
+                 for i in range(SEED_POSTS)]
+            )
+
+    def connect(self, path, pragmas):
+        db = sqlite3.connect(path, isolation_level=None)
+        apply_pragmas(db, pragmas)
+        return db
+
+    def operation(self, db):
+        if random.random() < self.options['writes']:
+            post = random.choice(self.posts)
+            db.execute('BEGIN')
+            try:
+                db.execute(
+                    'INSERT INTO posts_comment (post_id, author_id, text, '
+                    'created) VALUES (?, ?, ?, ?)',
+                    (post, random.choice(self.users), 'Benchmark',
+                     timezone.now().isoformat())
+                )
+                db.execute(
+                    'UPDATE posts_post SET comment_count = comment_count + 1,'
+                    ' version = version + 1 WHERE id = ?', (post,)
+                )
+                db.execute('COMMIT')
+            except sqlite3.Error:
+                db.execute('ROLLBACK')
+                raise
+            return 'write'
+        db.execute(self.feed_sql).fetchall()
+        db.execute(self.post_sql, (random.choice(self.posts),)).fetchall()
+        return 'read'
+
+    def run(self, path, pragmas, persistent):
+        deadline = time.monotonic() + self.options['seconds']
+        lock = threading.Lock()
+        result = {'read': 0, 'write': 0, 'errors': 0, 'latency': []}
+
+        def worker():
+            db = self.connect(path, pragmas) if persistent else None
+            done = {'read': 0, 'write': 0, 'errors': 0, 'latency': []}
+            while time.monotonic() < deadline:
+                started = time.monotonic()
+                current = db or self.connect(path, pragmas)
+                try:
+                    done[self.operation(current)] += 1
+                except sqlite3.OperationalError:
+                    done['errors'] += 1
+                finally:
+                    if db is None:
+                        current.close()
+                done['latency'].append(time.monotonic() - started)
+            if db is not None:
+                db.close()
+            with lock:
+                for key, value in done.items():
+                    result[key] += value
+
+        threads = [
+            threading.Thread(target=worker)
+            for _ in range(self.options['threads'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return result
+
+    def report(self, name, result):
+        seconds = self.options['seconds']
+        latency = sorted(result['latency']) or [0]
+
+        def percentile(share):
+            return latency[min(int(len(latency) * share), len(latency) - 1)]
+
+        self.stdout.write(
+            '{:8} {:8.0f} оп/с (чтение {:.0f}, запись {:.0f}), '
+            'p50 {:.2f} мс, p99 {:.2f} мс, ошибок {}'.format(
+                name,
+                (result['read'] + result['write']) / seconds,
+                result['read'] / seconds,
+                result['write'] / seconds,
+                percentile(0.5) * 1000,
+                percentile(0.99) * 1000,
+                result['errors'],
+            )
+        )
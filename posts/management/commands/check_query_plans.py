@@ -0,0 +1,114 @@
+import re
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+from posts.paginator import encode_cursor
+
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?\w+$')
+TEMP_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+# Сигналы временных данных пишут в кеш, а откат транзакции его не
+# касается: пока собираются запросы, кеш подменяется пустым в памяти.
+SCRATCH_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'check-query-plans',
+    }
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет EXPLAIN QUERY PLAN для всех запросов лент и страницы '
+        'записи и падает, если запрос читает таблицу целиком и '
+        'сортирует результат во временном B-дереве.'
+    )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда поддерживает только SQLite.')
+
+        failures = []
+        with override_settings(CACHES=SCRATCH_CACHES), transaction.atomic():
+            for url, queries in self.collect().items():
+                for sql, params in queries:
+                    plan = self.explain(sql, params)
+                    bad = any(FULL_SCAN.match(row) for row in plan) and (
+                        TEMP_SORT in plan
+                    )
+                    if bad:
+                        failures.append((url, sql, plan))
+                    if options['verbosity'] > 1:
+                        self.stdout.write('{}\n{}\n  {}\n'.format(
+                            url, sql, '\n  '.join(plan)
+                        ))
+            transaction.set_rollback(True)
+
+        for url, sql, plan in failures:
+            self.stderr.write('{}\n{}\n  {}\n'.format(
+                url, sql, '\n  '.join(plan)
+            ))
+        if failures:
+            raise CommandError(
+                'Запросов с полным чтением и сортировкой: {}'.format(
+                    len(failures)
+                )
+            )
+        self.stdout.write('Планы запросов в порядке.')
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def collect(self):
+        """
+        Открывает страницы на временных данных и собирает их SELECT-запросы.
+        """
+        suffix = uuid.uuid4().hex[:8]
+        reader = User.objects.create_user('plan-reader-' + suffix)
+        author = User.objects.create_user('plan-author-' + suffix)
+        group = Group.objects.create(
+            title=suffix, slug='plan-' + suffix, description=suffix
+        )
+        Follow.objects.create(user=reader, author=author)
+        post = Post.objects.create(author=author, group=group, text=suffix)
+        Comment.objects.create(post=post, author=reader, text=suffix)
+
+        client = Client()
+        client.force_login(reader)
+        urls = [
+            reverse('index'),
+            reverse('group', kwargs={'slug': group.slug}),
+            reverse('profile', kwargs={'username': author.username}),
+            reverse(
+                'post',
+                kwargs={'username': author.username, 'post_id': post.pk}
+            ),
+            reverse('follow_index'),
+        ]
+        cursor = encode_cursor(post)
+        collected = {}
+        for url, data in self.pages(urls, suffix, cursor):
+            queries = []
+
+            def capture(execute, sql, params, many, context):
+                if sql.lstrip().upper().startswith('SELECT'):
+                    queries.append((sql, params))
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(capture):
+                client.get(url, data)
+            collected['{}?{}'.format(url, '&'.join(data))] = queries
+        return collected
+
+    def pages(self, urls, suffix, cursor):
+        # Уникальный параметр plan обходит кеш страниц.
+        for url in urls:
+            yield url, {'plan': suffix}
+            yield url, {'plan': suffix, 'after': cursor}
+            yield url, {'plan': suffix, 'before': cursor}
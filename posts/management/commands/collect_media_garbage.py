@@ -0,0 +1,203 @@
+import os
+import shutil
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.helpers import deserialize
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix, del_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedKVStore
+from sorl.thumbnail.models import KVStore
+
+from posts.models import Post, ProfilePhoto
+from yatube.routers import use_primary
+
+SOURCES = (
+    (Post, 'image'),
+    (ProfilePhoto, 'photo'),
+)
+BATCH_SIZE = 500
+
+
+def batches(iterable, size=BATCH_SIZE):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def walk(path, skip):
+    """
+    Обходит каталог потоком, не собирая список файлов в память.
+    """
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.path not in skip:
+                    yield from walk(entry.path, skip)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry
+
+
+def referenced(names):
+    """
+    Какие из путей names используются записями, аватарами или как
+    DEFAULT_AVATAR.
+    """
+    found = {settings.DEFAULT_AVATAR} & set(names)
+    for model, field in SOURCES:
+        found.update(model.objects.filter(
+            **{'{}__in'.format(field): names}
+        ).values_list(field, flat=True))
+    return found
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет или переносит в карантин файлы MEDIA_ROOT, на которые '
+        'не ссылается ни одна запись, и чистит хранилище миниатюр sorl '
+        'от записей об удалённых изображениях.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что было бы удалено.'
+        )
+        parser.add_argument(
+            '--quarantine', metavar='DIR',
+            help='Переносить файлы в DIR вместо удаления.'
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=settings.MEDIA_GC_MIN_AGE,
+            help='Не трогать файлы моложе стольких секунд.'
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.dry_run = options['dry_run']
+        # При пробном прогоне записи KV не удаляются, поэтому ключи,
+        # которые были бы удалены, запоминаются для проверки файлов.
+        self.doomed = set()
+        self.files = self.size = self.entries = 0
+
+        # Без KV в базе живые миниатюры не отличить от брошенных.
+        self.with_kvstore = isinstance(default.kvstore, CachedKVStore)
+        # Ссылки проверяются по основной базе: отставшая реплика не
+        # знает о только что загруженных файлах.
+        with use_primary():
+            if self.with_kvstore:
+                self.prune_kvstore()
+            else:
+                self.stderr.write(
+                    'Хранилище миниатюр не в базе, миниатюры не проверяются.'
+                )
+            self.collect_files()
+
+        self.stdout.write(
+            '{}Файлов: {} ({:.1f} МБ), записей KV: {}'.format(
+                'Пробный прогон. ' if self.dry_run else '',
+                self.files, self.size / 2 ** 20, self.entries
+            )
+        )
+
+    def prune_kvstore(self):
+        prefix = add_prefix('')
+        last = prefix
+        while True:
+            rows = list(KVStore.objects.filter(
+                key__gt=last, key__startswith=prefix
+            ).order_by('key').values_list('key', 'value')[:BATCH_SIZE])
+            if not rows:
+                return
+            last = rows[-1][0]
+            sources = {}
+            for key, value in rows:
+                name = deserialize_image_file(value).name
+                if not name.startswith(sorl_settings.THUMBNAIL_PREFIX):
+                    sources[key] = name
+            live = referenced(list(set(sources.values())))
+            dead = [key for key, name in sources.items() if name not in live]
+            if dead:
+                self.drop_sources(dead)
+
+    def drop_sources(self, keys):
+        # Вместе с исходником удаляются список его миниатюр и их записи.
+        lists = [add_prefix(del_prefix(key), 'thumbnails') for key in keys]
+        thumbnails = [
+            add_prefix(key)
+            for value in KVStore.objects.filter(
+                key__in=lists
+            ).values_list('value', flat=True)
+            for key in deserialize(value)
+        ]
+        doomed = keys + lists + thumbnails
+        self.entries += len(keys) + len(thumbnails)
+        if self.dry_run:
+            self.doomed.update(thumbnails)
+            return
+        for batch in batches(doomed):
+            default.kvstore._delete_raw(*batch)
+
+    def collect_files(self):
+        root = settings.MEDIA_ROOT
+        skip = set()
+        if self.options['quarantine']:
+            skip.add(os.path.abspath(self.options['quarantine']))
+        upload_dirs = {
+            model._meta.get_field(field).upload_to.strip('/')
+            for model, field in SOURCES
+        }
+        cutoff = time.time() - self.options['min_age']
+        entries = (
+            entry for entry in walk(root, skip)
+            if entry.stat().st_mtime < cutoff
+        )
+        for batch in batches(entries):
+            names = {
+                os.path.relpath(entry.path, root).replace(os.sep, '/'): entry
+                for entry in batch
+            }
+            thumbnails = [
+                name for name in names
+                if name.startswith(sorl_settings.THUMBNAIL_PREFIX)
+            ] if self.with_kvstore else []
+            sources = [
+                name for name in names if name.split('/')[0] in upload_dirs
+            ]
+            orphans = self.orphan_thumbnails(thumbnails)
+            orphans += sorted(set(sources) - referenced(sources))
+            for name in orphans:
+                self.dispose(name, names[name])
+
+    def orphan_thumbnails(self, names):
+        # Миниатюра жива, пока в KV есть запись о ней.
+        keys = {
+            add_prefix(ImageFile(name, default.storage).key): name
+            for name in names
+        }
+        stored = set(KVStore.objects.filter(
+            key__in=list(keys)
+        ).values_list('key', flat=True)) - self.doomed
+        return sorted(name for key, name in keys.items() if key not in stored)
+
+    def dispose(self, name, entry):
+        self.files += 1
+        self.size += entry.stat().st_size
+        if self.options['verbosity'] > 1:
+            self.stdout.write(name)
+        if self.dry_run:
+            return
+        quarantine = self.options['quarantine']
+        if quarantine:
+            target = os.path.join(quarantine, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(entry.path, target)
+        else:
+            os.remove(entry.path)
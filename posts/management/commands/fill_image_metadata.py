@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from posts.images import METADATA, describe
+from posts.models import Post, ProfilePhoto
+
+SOURCES = (
+    (Post, 'image'),
+    (ProfilePhoto, 'photo'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет размеры, вес и средний цвет изображений у записей '
+        'и аватаров, загруженных до появления этих полей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько строк сохранять одним запросом.'
+        )
+
+    def handle(self, *args, **options):
+        for model, name in SOURCES:
+            filled, failed = self.fill(model, name, options['batch_size'])
+            self.stdout.write('{}: заполнено {}, ошибок {}'.format(
+                model._meta.verbose_name_plural, filled, failed
+            ))
+
+    def fill(self, model, name, batch_size):
+        fields = ['{}_{}'.format(name, key) for key in METADATA]
+        queryset = model.objects.filter(
+            **{'{}_width__isnull'.format(name): True}
+        ).exclude(Q(**{name: ''}) | Q(**{'{}__isnull'.format(name): True}))
+        batch = []
+        filled = failed = 0
+        for instance in queryset.only('pk', name).iterator():
+            file_ = getattr(instance, name)
+            try:
+                with file_.open('rb'):
+                    values = describe(file_)
+            except OSError as error:
+                failed += 1
+                self.stderr.write('{}: {}'.format(file_.name, error))
+                continue
+            for key, value in values.items():
+                setattr(instance, '{}_{}'.format(name, key), value)
+            batch.append(instance)
+            if len(batch) >= batch_size:
+                model.objects.bulk_update(batch, fields)
+                filled += len(batch)
+                batch = []
+        model.objects.bulk_update(batch, fields)
+        return filled + len(batch), failed
@@ -0,0 +1,98 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from posts import cards
+from posts.caching import bump_generation
+from posts.models import Post, ProfilePhoto, User
+from posts.profiles import forget_header
+from posts.thumbnails import generate
+
+# Каталог в MEDIA_ROOT и набор вариантов для его файлов.
+SOURCES = (
+    ('posts', 'post'),
+    ('users', 'avatar'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит все варианты миниатюр для уже загруженных изображений '
+        'записей и профилей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.THUMBNAIL_WORKERS,
+            help='Сколько изображений обрабатывать параллельно.'
+        )
+
+    def handle(self, *args, **options):
+        jobs = [(settings.DEFAULT_AVATAR, 'avatar')]
+        for directory, kind in SOURCES:
+            if default_storage.exists(directory):
+                jobs.extend((name, kind) for name in self.walk(directory))
+
+        ready = {kind: set() for directory, kind in SOURCES}
+        failed = 0
+        for (name, kind), error in self.run(jobs, options['workers']):
+            if error is not None:
+                failed += 1
+                self.stderr.write('{}: {}'.format(name, error))
+            else:
+                ready[kind].add(name)
+        self.invalidate(ready)
+        self.stdout.write('Обработано изображений: {}, ошибок: {}'.format(
+            len(jobs), failed
+        ))
+
+    def invalidate(self, ready):
+        # Карточки, ленты и шапки профилей, собранные до миниатюр,
+        # ссылаются на исходные изображения.
+        posts = Post.objects.filter(image__in=ready['post'])
+        for post_id in posts.values_list('pk', flat=True).iterator():
+            cards.bump(post_id)
+        users = ProfilePhoto.objects.filter(
+            photo__in=ready['avatar']
+        ).values_list('user_id', flat=True)
+        if settings.DEFAULT_AVATAR in ready['avatar']:
+            users = users.union(
+                User.objects.filter(profile_photo=None).values_list(
+                    'pk', flat=True
+                )
+            )
+        for user_id in users.iterator():
+            forget_header(user_id)
+        bump_generation('index')
+
+    def walk(self, directory):
+        # Файлы с именем по содержимому лежат в подкаталогах.
+        directories, files = default_storage.listdir(directory)
+        for name in files:
+            yield '{}/{}'.format(directory, name)
+        for name in directories:
+            yield from self.walk('{}/{}'.format(directory, name))
+
+    def run(self, jobs, workers):
+        if workers <= 1:
+            yield from map(self.process, jobs)
+            return
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield from executor.map(self.process_in_thread, jobs)
+
+    def process(self, job):
+        name, kind = job
+        try:
+            generate(name, kind)
+        except Exception as error:
+            return job, error
+        return job, None
+
+    def process_in_thread(self, job):
+        try:
+            return self.process(job)
+        finally:
+            close_old_connections()
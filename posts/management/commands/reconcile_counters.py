@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import reconcile
+from yatube.routers import use_primary
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики записей, комментариев и подписок.'
+
+    def handle(self, *args, **options):
+        with use_primary():
+            fixed = reconcile()
+        self.stdout.write('Исправлено строк: {}'.format(fixed))
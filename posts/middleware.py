@@ -0,0 +1,122 @@
+import logging
+import re
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import thumbnails
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDERS = re.compile(r'%s(?:, %s)*')
+NUMBERS = re.compile(r'\b\d+\b')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(limit):
+    """
+    Объявляет, сколько SQL-запросов допустимо для представления.
+    """
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def query_shape(sql):
+    """
+    Приводит запрос к форме без параметров, чтобы находить повторы.
+    """
+    return NUMBERS.sub('?', PLACEHOLDERS.sub('?', sql))
+
+
+class QueryCounter:
+    """
+    Считает запросы ко всем базам внутри блока with.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __len__(self):
+        return len(self.queries)
+
+    def duplicates(self):
+        shapes = Counter(query_shape(sql) for sql in self.queries)
+        return {shape: count for shape, count in shapes.items() if count > 1}
+
+
+class QueryBudgetMiddleware:
+    """
+    Считает запросы и повторяющиеся формы запросов на каждый запрос.
+    Если представление вышло за объявленный бюджет, пишет в лог, а при
+    QUERY_BUDGET_RAISE = True бросает QueryBudgetExceeded.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.query_budget = None
+        with QueryCounter() as counter:
+            response = self.get_response(request)
+        self.check(request, counter)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
+
+    def check(self, request, counter):
+        budget = request.query_budget
+        if budget is None:
+            budget = settings.QUERY_BUDGET_DEFAULT
+        duplicates = counter.duplicates()
+        if duplicates:
+            logger.debug(
+                '%s: repeated queries %s', request.path, duplicates
+            )
+        if budget is None or len(counter) <= budget:
+            return
+        message = '{}: {} queries, budget {}, repeated {}'.format(
+            request.path, len(counter), budget, sorted(duplicates.values())
+        )
+        logger.warning(message)
+        if settings.QUERY_BUDGET_RAISE:
+            raise QueryBudgetExceeded(message)
+
+
+class ThumbnailLookupMiddleware:
+    """
+    Сообщает в заголовке X-Thumbnail-Lookups, сколько раз запрос
+    обращался к хранилищу миниатюр sorl.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        thumbnails.reset_lookup_count()
+        response = self.get_response(request)
+        count = thumbnails.lookup_count()
+        response['X-Thumbnail-Lookups'] = count
+        logger.debug('%s: %s thumbnail lookups', request.path, count)
+        return response
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    from posts.search import ensure_index
+
+    ensure_index(schema_editor.connection)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in (
+        'DROP TRIGGER IF EXISTS posts_post_fts_insert',
+        'DROP TRIGGER IF EXISTS posts_post_fts_delete',
+        'DROP TRIGGER IF EXISTS posts_post_fts_update',
+        'DROP TABLE IF EXISTS posts_post_fts',
+    ):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_image_metadata'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
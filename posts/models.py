@@ -13,6 +13,21 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """
+        Записи для лент: автор и сообщество загружаются тем же запросом,
+        число комментариев берётся из хранимого comment_count, а поля,
+        которые карточка никогда не показывает, не выбираются.
+        """
+        return self.select_related('author', 'group').defer(
+            'author__password',
+            'author__last_login',
+            'author__date_joined',
+            'group__description',
+        )
+
+
 class Post(models.Model):
     text = models.TextField(help_text='Что нового?', verbose_name='Текст')
     pub_date = models.DateTimeField('date published', auto_now_add=True)
@@ -32,6 +47,47 @@ class Post(models.Model):
         blank=True, null=True,
         verbose_name='Изображение'
     )
+    # Размеры и средний цвет изображения, см. posts.images.
+    image_width = models.PositiveIntegerField(
+        blank=True, null=True, editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        blank=True, null=True, editable=False
+    )
+    image_size = models.PositiveIntegerField(
+        blank=True, null=True, editable=False
+    )
+    image_color = models.CharField(
+        max_length=7, blank=True, null=True, editable=False
+    )
+    # False - запись автора с большим числом подписчиков, она не
+    # раскладывается по лентам и подмешивается при чтении.
+    fanned_out = models.BooleanField(default=True, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    # Версия карточки записи в кеше, см. posts.cards.
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['pub_date', 'id'],
+                name='post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', 'pub_date', 'id'],
+                name='post_group_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', 'pub_date', 'id'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['fanned_out', 'author', 'pub_date'],
+                name='post_fanned_out_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text
@@ -54,6 +110,14 @@ class Comment(models.Model):
     )
     created = models.DateTimeField('date published', auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', 'created'],
+                name='comment_post_created_idx'
+            ),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -68,6 +132,12 @@ class Follow(models.Model):
     )
     class Meta:
         unique_together = ['user', 'author']
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx'
+            ),
+        ]
 
 
 class ProfilePhoto(models.Model):
@@ -76,6 +146,18 @@ class ProfilePhoto(models.Model):
         blank=True, null=True,
         verbose_name='Аватар',
     )
+    photo_width = models.PositiveIntegerField(
+        blank=True, null=True, editable=False
+    )
+    photo_height = models.PositiveIntegerField(
+        blank=True, null=True, editable=False
+    )
+    photo_size = models.PositiveIntegerField(
+        blank=True, null=True, editable=False
+    )
+    photo_color = models.CharField(
+        max_length=7, blank=True, null=True, editable=False
+    )
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -83,3 +165,43 @@ class ProfilePhoto(models.Model):
     )
     class Meta:
         unique_together = ['user', 'photo']
+
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    post = models.ForeignKey(
+        'Post',
+        on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    # Копия post.pub_date: лента сортируется и листается по индексу
+    # timeline_user_pub_date_idx без сортировки во временном B-дереве.
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['user', 'post']
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_pub_date_idx'
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    """
+    Хранимые счётчики пользователя, обновляются сигналами.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
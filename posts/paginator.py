@@ -0,0 +1,179 @@
+import base64
+import binascii
+import heapq
+from collections.abc import Sequence
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(post, field='pub_date', key='pk'):
+    """
+    Превращает позицию записи (pub_date, id) в непрозрачный токен.
+    """
+    raw = '{}|{}'.format(getattr(post, field).isoformat(), getattr(post, key))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Разбирает токен курсора. Для испорченного токена возвращает None.
+    """
+    if not token:
+        return None
+    try:
+        padding = '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(token + padding).decode()
+        pub_date, pk = raw.rsplit('|', 1)
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+class CursorPage(Sequence):
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._next_cursor = next_cursor
+        self._previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<CursorPage of {} items>'.format(len(self.object_list))
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._next_cursor is not None
+
+    def has_previous(self):
+        return self._previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_cursor(self):
+        return self._next_cursor
+
+    def previous_cursor(self):
+        return self._previous_cursor
+
+
+class CursorPaginator:
+    """
+    Постраничный вывод по ключу (pub_date, id) без COUNT(*) и OFFSET.
+
+    object_list - queryset записей или список querysets, которые
+    сливаются в одну ленту по убыванию (pub_date, id). field - поле
+    даты вместо pub_date, например created у комментариев, key - поле
+    вместо id для записей с одинаковой датой.
+    """
+
+    def __init__(self, object_list, per_page, field='pub_date', key='pk'):
+        if isinstance(object_list, (list, tuple)):
+            self.sources = list(object_list)
+        else:
+            self.sources = [object_list]
+        self.per_page = int(per_page)
+        self.field = field
+        self.key = key
+
+    def _cursor(self, post):
+        return encode_cursor(post, self.field, self.key)
+
+    def _fetch(self, source, cursor, backwards, limit):
+        field, key = self.field, self.key
+        if cursor is not None:
+            date, pk = cursor
+            if backwards:
+                source = source.filter(
+                    Q(**{field + '__gt': date}) |
+                    Q(**{field: date, key + '__gt': pk})
+                )
+            else:
+                source = source.filter(
+                    Q(**{field + '__lt': date}) |
+                    Q(**{field: date, key + '__lt': pk})
+                )
+        if backwards:
+            source = source.order_by(field, key)
+        else:
+            source = source.order_by('-' + field, '-' + key)
+        return list(source[:limit])
+
+    def _merge(self, cursor, backwards, limit):
+        rows = heapq.merge(
+            *(
+                self._fetch(source, cursor, backwards, limit)
+                for source in self.sources
+            ),
+            key=lambda post: (
+                getattr(post, self.field), getattr(post, self.key)
+            ),
+            reverse=not backwards
+        )
+        result = []
+        seen = set()
+        for post in rows:
+            if post.pk in seen:
+                continue
+            seen.add(post.pk)
+            result.append(post)
+            if len(result) == limit:
+                break
+        return result
+
+    def get_page(self, after=None, before=None):
+        """
+        Возвращает страницу после курсора after или перед курсором before.
+        Без курсора (или с испорченным) возвращается первая страница.
+        """
+        limit = self.per_page + 1
+        before_cursor = decode_cursor(before)
+        if before_cursor is not None:
+            rows = self._merge(before_cursor, True, limit)
+            has_previous = len(rows) == limit
+            rows = rows[:self.per_page]
+            rows.reverse()
+            return CursorPage(
+                rows,
+                self,
+                self._cursor(rows[-1]) if rows else before,
+                self._cursor(rows[0]) if has_previous else None
+            )
+
+        after_cursor = decode_cursor(after)
+        rows = self._merge(after_cursor, False, limit)
+        has_next = len(rows) == limit
+        rows = rows[:self.per_page]
+        previous_cursor = None
+        if after_cursor is not None:
+            previous_cursor = self._cursor(rows[0]) if rows else after
+        return CursorPage(
+            rows,
+            self,
+            self._cursor(rows[-1]) if has_next else None,
+            previous_cursor
+        )
+
+
+def paginate(request, post_list, field='pub_date', key='pk'):
+    """
+    Общий для всех лент разбор ?after=/?before= из запроса.
+    """
+    paginator = CursorPaginator(
+        post_list, settings.POSTS_PER_PAGE, field, key
+    )
+    page = paginator.get_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+    return page, paginator
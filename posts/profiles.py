@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.db.models import BooleanField, Exists, OuterRef, Subquery, Value
+from django.template.loader import render_to_string
+
+from .caching import bump_generation, generation, get_or_build
+from .counters import user_stats
+from .lookups import get_user_or_404
+from .models import Follow, ProfilePhoto, User
+
+
+def _header_name(user_id):
+    return 'profile_header:{}'.format(user_id)
+
+
+def header_scope(user_id):
+    """
+    Имя поколения, которое сменяется вместе с шапкой профиля.
+    """
+    return _header_name(user_id)
+
+
+def get_profile(username, viewer):
+    """
+    Одним запросом загружает пользователя со счётчиками, путём к
+    аватару (avatar), его средним цветом (avatar_color) и признаком
+    подписки зрителя (is_followed). id берётся из кеша имён, имя
+    сверяется тем же запросом.
+    """
+    photos = ProfilePhoto.objects.filter(
+        user=OuterRef('pk')
+    ).exclude(photo='').order_by('-pk')
+    if viewer.is_authenticated:
+        is_followed = Exists(
+            Follow.objects.filter(user=viewer.pk, author=OuterRef('pk'))
+        )
+    else:
+        is_followed = Value(False, output_field=BooleanField())
+    queryset = User.objects.select_related('stats').annotate(
+        avatar=Subquery(photos.values('photo')[:1]),
+        avatar_color=Subquery(photos.values('photo_color')[:1]),
+        is_followed=is_followed,
+    )
+    return get_user_or_404(queryset, username)
+
+
+def render_header(profile):
+    """
+    Шапка профиля кешируется для каждого пользователя до смены фото,
+    подписок или числа записей.
+    """
+    key = 'profile_header:{}:{}'.format(
+        profile.pk, generation(_header_name(profile.pk))
+    )
+
+    def build():
+        stats = user_stats(profile)
+        return render_to_string(
+            'posts/includes/profile_view.html',
+            {
+                'profile': profile,
+                'photo': profile.avatar or settings.DEFAULT_AVATAR,
+                'color': profile.avatar_color,
+                'amount': stats.posts_count,
+                'follows': stats.following_count,
+                'followers': stats.followers_count,
+            }
+        )
+
+    return get_or_build(key, build, settings.PROFILE_HEADER_TIMEOUT)
+
+
+def forget_header(user_id):
+    bump_generation(_header_name(user_id))
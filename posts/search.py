@@ -0,0 +1,205 @@
+"""
+Полнотекстовый поиск по записям на SQLite FTS5. Индекс posts_post_fts
+хранит только токены, текст берётся из posts_post (external content),
+а триггеры обновляют индекс при любом INSERT, UPDATE и DELETE.
+"""
+import base64
+import binascii
+import re
+
+from django.db import connection
+
+from .models import Post
+from .paginator import CursorPage
+
+WORDS = re.compile(r'\w+')
+
+TRIGGERS = {
+    'posts_post_fts_insert': '''
+        CREATE TRIGGER IF NOT EXISTS posts_post_fts_insert
+        AFTER INSERT ON posts_post BEGIN
+            INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text);
+        END
+    ''',
+    'posts_post_fts_delete': '''
+        CREATE TRIGGER IF NOT EXISTS posts_post_fts_delete
+        AFTER DELETE ON posts_post BEGIN
+            INSERT INTO posts_post_fts(posts_post_fts, rowid, text)
+            VALUES ('delete', old.id, old.text);
+        END
+    ''',
+    'posts_post_fts_update': '''
+        CREATE TRIGGER IF NOT EXISTS posts_post_fts_update
+        AFTER UPDATE OF text ON posts_post BEGIN
+            INSERT INTO posts_post_fts(posts_post_fts, rowid, text)
+            VALUES ('delete', old.id, old.text);
+            INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text);
+        END
+    ''',
+}
+
+
+def ensure_index(using=connection):
+    """
+    Создаёт индекс и триггеры, если их нет. SQLite пересоздаёт таблицу
+    при изменении её схемы в миграциях, и триггеры пропадают вместе со
+    старой таблицей, поэтому проверка идёт после каждого migrate.
+    Если триггеров не было, индекс перестраивается целиком.
+    """
+    if using.vendor != 'sqlite':
+        return
+    with using.cursor() as cursor:
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS posts_post_fts USING fts5("
+            "text, content='posts_post', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+            "AND tbl_name = 'posts_post'"
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = set(TRIGGERS) - existing
+        for name in sorted(missing):
+            cursor.execute(TRIGGERS[name])
+        if missing:
+            cursor.execute(
+                "INSERT INTO posts_post_fts(posts_post_fts) VALUES ('rebuild')"
+            )
+
+
+def match_query(text):
+    """
+    Превращает строку пользователя в запрос FTS5: все слова должны
+    встретиться, каждое может быть началом слова в тексте.
+    """
+    words = WORDS.findall(text.lower())
+    if not words:
+        return None
+    return ' '.join('"{}"*'.format(word) for word in words)
+
+
+def encode_cursor(post):
+    raw = '{!r}|{}'.format(post.search_rank, post.pk)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        padding = '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(token + padding).decode()
+        rank, pk = raw.rsplit('|', 1)
+        return float(rank), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+class SearchPaginator:
+    """
+    Постраничный вывод результатов поиска по ключу (rank, id): сначала
+    лучшие по bm25, при равенстве - более новые записи.
+    """
+
+    def __init__(self, query, per_page, group=None, author=None):
+        self.query = match_query(query)
+        self.per_page = int(per_page)
+        self.group = group
+        self.author = author
+
+    def _fetch(self, cursor, backwards, limit):
+        sql = [
+            'SELECT p.id, bm25(posts_post_fts) AS score',
+            'FROM posts_post_fts JOIN posts_post p',
+            'ON p.id = posts_post_fts.rowid',
+            'WHERE posts_post_fts MATCH %s',
+        ]
+        params = [self.query]
+        if self.group:
+            sql.append(
+                'AND p.group_id = (SELECT id FROM posts_group WHERE slug = %s)'
+            )
+            params.append(self.group)
+        if self.author:
+            sql.append(
+                'AND p.author_id = '
+                '(SELECT id FROM auth_user WHERE username = %s)'
+            )
+            params.append(self.author)
+        if cursor is not None:
+            rank, pk = cursor
+            if backwards:
+                sql.append(
+                    'AND (bm25(posts_post_fts) < %s OR '
+                    '(bm25(posts_post_fts) = %s AND p.id > %s))'
+                )
+            else:
+                sql.append(
+                    'AND (bm25(posts_post_fts) > %s OR '
+                    '(bm25(posts_post_fts) = %s AND p.id < %s))'
+                )
+            params.extend([rank, rank, pk])
+        if backwards:
+            sql.append('ORDER BY score DESC, p.id')
+        else:
+            sql.append('ORDER BY score, p.id DESC')
+        sql.append('LIMIT %s')
+        params.append(limit)
+        with connection.cursor() as db:
+            db.execute(' '.join(sql), params)
+            rows = db.fetchall()
+
+        posts = Post.objects.for_feed().in_bulk([pk for pk, _ in rows])
+        result = []
+        for pk, rank in rows:
+            post = posts.get(pk)
+            if post is not None:
+                post.search_rank = rank
+                result.append(post)
+        return result
+
+    def get_page(self, after=None, before=None):
+        """
+        Как CursorPaginator.get_page, но курсор - позиция в выдаче.
+        """
+        if self.query is None:
+            return CursorPage([], self, None, None)
+        limit = self.per_page + 1
+        before_cursor = decode_cursor(before)
+        if before_cursor is not None:
+            rows = self._fetch(before_cursor, True, limit)
+            has_previous = len(rows) == limit
+            rows = rows[:self.per_page]
+            rows.reverse()
+            return CursorPage(
+                rows,
+                self,
+                encode_cursor(rows[-1]) if rows else before,
+                encode_cursor(rows[0]) if has_previous else None
+            )
+
+        after_cursor = decode_cursor(after)
+        rows = self._fetch(after_cursor, False, limit)
+        has_next = len(rows) == limit
+        rows = rows[:self.per_page]
+        previous_cursor = None
+        if after_cursor is not None:
+            previous_cursor = encode_cursor(rows[0]) if rows else after
+        return CursorPage(
+            rows,
+            self,
+            encode_cursor(rows[-1]) if has_next else None,
+            previous_cursor
+        )
+
+
+def search_ids(query):
+    """
+    SQL и параметры подзапроса id записей, подходящих под query,
+    для фильтра pk__in.
+    """
+    return (
+        'SELECT rowid FROM posts_post_fts WHERE posts_post_fts MATCH %s',
+        [match_query(query)]
+    )
@@ -0,0 +1,140 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import autocomplete, cards, counters, lookups, timeline
+from .images import fill_metadata
+from .caching import bump_generation, comments_scope
+from .models import (
+    Comment, Follow, Group, Post, ProfilePhoto, User, UserStats
+)
+from .profiles import forget_header
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance.pk is None:
+        return
+    fields = ('username', 'first_name', 'last_name')
+    if update_fields is not None and not set(fields) & set(update_fields):
+        return
+    old = User.objects.filter(pk=instance.pk).values_list(*fields).first()
+    if old is None:
+        return
+    if old[0] != instance.username:
+        # После переименования старое имя не должно вести на пользователя.
+        lookups.forget_username(old[0])
+        instance._renamed = True
+    if old != tuple(getattr(instance, field) for field in fields):
+        # Имя автора есть в лентах, в том числе в JSON API.
+        instance._names_changed = True
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, update_fields=None,
+               **kwargs):
+    if raw:
+        return
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+    elif update_fields == frozenset(['last_login']):
+        return
+    else:
+        forget_header(instance.pk)
+        if instance.__dict__.pop('_renamed', False):
+            cards.bump_posts(author=instance.pk)
+        if instance.__dict__.pop('_names_changed', False):
+            bump_generation('index')
+    lookups.remember_username(instance)
+    autocomplete.user_changed(instance)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    lookups.forget_username(instance.username)
+    autocomplete.forget('user', instance.pk)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        autocomplete.group_changed(instance)
+        if not created:
+            cards.bump_posts(group=instance.pk)
+        bump_generation('index')
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    autocomplete.forget('group', instance.pk)
+    bump_generation('index')
+
+
+@receiver(pre_save, sender=ProfilePhoto)
+def photo_saving(sender, instance, raw=False, **kwargs):
+    if not raw:
+        fill_metadata(instance, 'photo')
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, raw=False, **kwargs):
+    if not raw:
+        fill_metadata(instance, 'image')
+
+
+@receiver(post_save, sender=ProfilePhoto)
+@receiver(post_delete, sender=ProfilePhoto)
+def photo_changed(sender, instance, **kwargs):
+    forget_header(instance.user_id)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    bump_generation('index')
+    if created:
+        counters.post_added(instance)
+        forget_header(instance.author_id)
+        timeline.fan_out(instance)
+    else:
+        cards.bump(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.post_added(instance, -1)
+    forget_header(instance.author_id)
+    cards.forget(instance)
+    bump_generation('index')
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.comment_added(instance)
+        bump_generation('index')
+        bump_generation(comments_scope(instance.post_id))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.comment_added(instance, -1)
+    bump_generation('index')
+    bump_generation(comments_scope(instance.post_id))
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.follow_added(instance)
+        forget_header(instance.user_id)
+        forget_header(instance.author_id)
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.follow_added(instance, -1)
+    forget_header(instance.user_id)
+    forget_header(instance.author_id)
+    timeline.trim(instance.user_id, instance.author_id)
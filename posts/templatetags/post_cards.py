@@ -0,0 +1,17 @@
+from django import template
+from django.conf import settings
+from django.utils.safestring import mark_safe
+
+from posts.cards import render_card
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post, position=1):
+    """
+    {% post_card post forloop.counter %} - карточка записи; начиная с
+    позиции THUMBNAIL_EAGER_CARDS + 1 картинка грузится лениво.
+    """
+    lazy = position > settings.THUMBNAIL_EAGER_CARDS
+    return mark_safe(render_card(post, context.get('user'), lazy))
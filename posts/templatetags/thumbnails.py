@@ -0,0 +1,31 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def ready_thumbnails(file_, kind):
+    """
+    {% ready_thumbnails photo "avatar" as im %} - готовые варианты
+    миниатюры или заглушка, пока фоновый пул их не построил.
+    """
+    return (
+        thumbnails.ready_thumbnails(file_, kind)
+        or thumbnails.Placeholder(kind)
+    )
+
+
+@register.simple_tag
+def post_thumbnail(post):
+    """
+    Миниатюра записи из общего для страницы запроса, если записи
+    прошли через prefetch_thumbnails, иначе отдельным обращением.
+    """
+    batch = getattr(post, 'thumbnail_batch', None)
+    if batch is None:
+        found = thumbnails.ready_thumbnails(post.image, 'post')
+    else:
+        found = batch.get(post)
+    return found or thumbnails.Placeholder('post')
@@ -1,17 +1,70 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404, HttpResponse
 from django.core.cache import cache
 from django.core.files.base import File
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
 from django.shortcuts import get_object_or_404
-from django.test import Client, TestCase
+from django.test import Client, RequestFactory, TestCase, override_settings
 from django.urls import reverse
 
+from . import autocomplete
 from .forms import PostForm
-from .models import Comment, Follow, Group, Post
+from .lookups import get_post_or_404
+from .models import (
+    Comment, Follow, Group, Post, ProfilePhoto, TimelineEntry, UserStats
+)
+from .caching import (
+    cached_page, flush_page_cache_stats, generation, get_or_build,
+    page_cache_stats, page_key
+)
+from .cards import card_key
+from .middleware import (
+    QueryBudgetExceeded, QueryBudgetMiddleware, QueryCounter, query_budget
+)
+from .paginator import CursorPaginator
+from .profiles import get_profile
+from .thumbnails import (
+    generate_post, prefetch_thumbnails, ready_thumbnails, variants
+)
+from .timeline import timeline_sources
 
 User = get_user_model()
 
 
+class TemporaryMedia:
+    """
+    Класс тестов пишет файлы во временный MEDIA_ROOT (его задаёт
+    override_settings у класса) с копией DEFAULT_AVATAR и удаляет его
+    после себя.
+    """
+    source = settings.MEDIA_ROOT
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        shutil.copy(
+            os.path.join(cls.source, settings.DEFAULT_AVATAR),
+            settings.MEDIA_ROOT
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+
 class TestPosts(TestCase):
     def setUp(self):
         self.client_not_auth = Client()
@@ -292,7 +345,8 @@ class TestError(TestCase):
         self.assertEqual(response.status_code, 404)
 
 
-class TestImage(TestCase):
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class TestImage(TemporaryMedia, TestCase):
     def setUp(self):
         self.client = Client()
         self.user = User.objects.create_user(
@@ -396,20 +450,107 @@ class TestCache(TestCase):
         self.user = User.objects.create_user(
             username='sarah', email='connor.s@skynet.com', password='12345'
         )
+        flush_page_cache_stats()
+        cache.clear()
 
     def test_cache_index(self):
         response = self.client.get(reverse('index'))
         posts = response.context['page']
         posts_count = len(posts)
         self.assertEqual(posts_count, 0)
-        self.post = Post.objects.create(author=self.user, text='Text post 6')
+        self.assertEqual(response['X-Cache'], 'MISS')
         response = self.client.get(reverse('index'))
-        self.assertNotContains(response, self.post.text)
-        cache.clear()
+        self.assertEqual(response['X-Cache'], 'HIT')
+        # Новая запись сбрасывает кеш сразу.
+        self.post = Post.objects.create(author=self.user, text='Text post 6')
         response = self.client.get(reverse('index'))
+        self.assertContains(response, self.post.text)
         posts = response.context['page']
         posts_count = len(posts)
         self.assertEqual(posts_count, 1)
+        self.post.text = 'Text post 6 edited'
+        self.post.save()
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, self.post.text)
+        self.post.delete()
+        response = self.client.get(reverse('index'))
+        self.assertNotContains(response, self.post.text)
+        self.assertEqual(page_cache_stats('index'), {'hits': 1, 'misses': 4})
+
+    def test_cache_varies_by_user(self):
+        self.client.get(reverse('index'))
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertContains(response, self.user.username)
+
+
+class TestSingleFlight(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.builds = 0
+
+    def slow_view(self, request):
+        self.builds += 1
+        time.sleep(0.2)
+        return HttpResponse('page %s' % self.builds)
+
+    def request(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        return request
+
+    def run_concurrently(self, view, count=8):
+        responses = []
+        threads = [
+            threading.Thread(
+                target=lambda: responses.append(view(self.request()))
+            )
+            for i in range(count)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def test_one_rebuild_for_missing_page(self):
+        view = cached_page('test', 60)(self.slow_view)
+        responses = self.run_concurrently(view)
+        self.assertEqual(self.builds, 1)
+        self.assertEqual({r.content for r in responses}, {b'page 1'})
+
+    def test_one_rebuild_for_expired_page(self):
+        view = cached_page('test', 60)(self.slow_view)
+        key = page_key('test', self.request())
+        entry = (b'old', [('Content-Type', 'text/html')])
+        cache.set(key, (entry, time.time() - 1, 0.2), 60)
+        responses = self.run_concurrently(view)
+        self.assertEqual(self.builds, 1)
+        contents = sorted(r.content for r in responses)
+        self.assertEqual(contents, [b'old'] * 7 + [b'page 1'])
+
+    def test_headers_replayed(self):
+        def page(request):
+            response = HttpResponse('page', content_type='text/plain')
+            response['Vary'] = 'Accept-Language'
+            response['Cache-Control'] = 'private'
+            return response
+
+        view = cached_page('test', 60)(page)
+        view(self.request())
+        response = view(self.request())
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response['Vary'], 'Accept-Language')
+        self.assertEqual(response['Cache-Control'], 'private')
+
+    def test_early_refresh(self):
+        get_or_build('key', lambda: 'old', 60)
+        cache.set('key', ('old', time.time() + 1, 100.0), 60)
+        # Сборка занимает 100 секунд, до срока секунда - почти наверняка
+        # запись будет пересобрана заранее.
+        self.assertEqual(get_or_build('key', lambda: 'new', 60), 'new')
 
 
 class TestFollow(TestCase):
@@ -495,3 +636,1088 @@ class TestComments(TestCase):
         self.assertEqual(self.comment.text, text)
         self.assertEqual(self.comment.author, self.user)
         self.assertEqual(self.comment.post.id, self.post.id)
+
+
+class TestPagination(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345'
+        )
+        for i in range(25):
+            Post.objects.create(author=self.user, text='Text post %s' % i)
+        # Одинаковая дата у части записей проверяет порядок по id.
+        Post.objects.filter(pk__lte=5).update(
+            pub_date=Post.objects.get(pk=5).pub_date
+        )
+        self.expected = list(
+            Post.objects.order_by('-pub_date', '-pk').values_list(
+                'pk', flat=True
+            )
+        )
+        cache.clear()
+
+    def test_walk_forward_and_back(self):
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        page = paginator.get_page()
+        self.assertFalse(page.has_previous())
+        seen = [post.pk for post in page]
+        pages = [page]
+        while page.has_next():
+            page = paginator.get_page(after=page.next_cursor())
+            seen += [post.pk for post in page]
+            pages.append(page)
+        self.assertEqual(seen, self.expected)
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        page = paginator.get_page(before=pages[-1].previous_cursor())
+        self.assertEqual(list(page), list(pages[1]))
+        page = paginator.get_page(before=page.previous_cursor())
+        self.assertEqual(list(page), list(pages[0]))
+        self.assertFalse(page.has_previous())
+
+    def test_bad_cursor(self):
+        response = self.client.get(reverse('index'), {'after': '!!!'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [post.pk for post in response.context['page']],
+            self.expected[:10]
+        )
+
+    def test_views_links(self):
+        response = self.client.get(
+            reverse('profile', kwargs={'username': self.user.username})
+        )
+        page = response.context['page']
+        self.assertContains(response, '?after=%s' % page.next_cursor())
+        response = self.client.get(
+            reverse('profile', kwargs={'username': self.user.username}),
+            {'after': page.next_cursor()}
+        )
+        self.assertEqual(
+            [post.pk for post in response.context['page']],
+            self.expected[10:20]
+        )
+
+
+class TestTimeline(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.reader = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345'
+        )
+        self.author = User.objects.create_user(
+            username='t1000', email='t1000.s@skynet.com', password='54321'
+        )
+        self.client.force_login(self.reader)
+
+    def feed(self):
+        response = self.client.get(reverse('follow_index'))
+        return [post.pk for post in response.context['page']]
+
+    def test_fan_out_on_create(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Text post 8')
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.reader, post=post).exists()
+        )
+        self.assertEqual(self.feed(), [post.pk])
+        post.delete()
+        self.assertEqual(TimelineEntry.objects.count(), 0)
+
+    def test_backfill_and_trim(self):
+        post = Post.objects.create(author=self.author, text='Text post 9')
+        self.client.get(
+            reverse('profile_follow', kwargs={'username': 't1000'})
+        )
+        self.assertEqual(self.feed(), [post.pk])
+        self.client.get(
+            reverse('profile_unfollow', kwargs={'username': 't1000'})
+        )
+        self.assertEqual(TimelineEntry.objects.count(), 0)
+        self.assertEqual(self.feed(), [])
+
+    @override_settings(TIMELINE_BACKFILL_LIMIT=2)
+    def test_backfill_limit(self):
+        posts = [
+            Post.objects.create(author=self.author, text='Text post 9')
+            for _ in range(3)
+        ]
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.feed(), [posts[2].pk, posts[1].pk])
+        entry = TimelineEntry.objects.get(post=posts[2])
+        self.assertEqual(entry.pub_date, posts[2].pub_date)
+
+    def test_feed_uses_index(self):
+        source = timeline_sources(self.reader)[0]
+        sql, params = source.order_by(
+            '-feed_date', '-feed_pk'
+        )[:10].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('timeline_user_pub_date_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_popular_author_merge_on_read(self):
+        other = User.objects.create_user(
+            username='t800', email='t800.s@skynet.com', password='54321'
+        )
+        old = Post.objects.create(author=other, text='Text post 10')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.reader, author=other)
+        post = Post.objects.create(author=self.author, text='Text post 11')
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        self.assertEqual(self.feed(), [post.pk, old.pk])
+
+
+class TestCounters(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345'
+        )
+        self.user2 = User.objects.create_user(
+            username='t1000', email='t1000.s@skynet.com', password='54321'
+        )
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_counters(self):
+        post = Post.objects.create(author=self.user1, text='Text post 12')
+        Comment.objects.create(post=post, author=self.user2, text='Comment')
+        Follow.objects.create(user=self.user2, author=self.user1)
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.stats(self.user1).posts_count, 1)
+        self.assertEqual(self.stats(self.user1).followers_count, 1)
+        self.assertEqual(self.stats(self.user2).following_count, 1)
+        Follow.objects.all().delete()
+        post.delete()
+        self.assertEqual(self.stats(self.user1).posts_count, 0)
+        self.assertEqual(self.stats(self.user1).followers_count, 0)
+        self.assertEqual(self.stats(self.user2).following_count, 0)
+
+    def test_reconcile(self):
+        post = Post.objects.create(author=self.user1, text='Text post 13')
+        Comment.objects.create(post=post, author=self.user2, text='Comment')
+        Post.objects.update(comment_count=5)
+        UserStats.objects.filter(user=self.user1).update(posts_count=7)
+        UserStats.objects.filter(user=self.user2).delete()
+        call_command('reconcile_counters', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.stats(self.user1).posts_count, 1)
+        self.assertEqual(self.stats(self.user2).posts_count, 0)
+
+
+class TestQueryBudget(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345'
+        )
+        self.author = User.objects.create_user(
+            username='t1000', email='t1000.s@skynet.com', password='54321'
+        )
+        self.group = Group.objects.create(
+            title='Test group', slug='111', description='Test group'
+        )
+        Follow.objects.create(user=self.user, author=self.author)
+        for i in range(100):
+            post = Post.objects.create(
+                author=self.author, group=self.group, text='Text %s' % i
+            )
+        for i in range(100):
+            Comment.objects.create(post=post, author=self.user, text='C')
+        self.post = post
+        self.client.force_login(self.user)
+        cache.clear()
+
+    def assertQueryBudget(self, url):
+        """
+        Запрос укладывается в объявленный бюджет при 1, 10 и 100
+        записях на странице, и число запросов не растёт со страницей.
+        """
+        # Первый запрос строит миниатюры, его не учитываем.
+        self.client.get(url)
+        counts = []
+        for per_page in (1, 10, 100):
+            with override_settings(
+                POSTS_PER_PAGE=per_page, QUERY_BUDGET_RAISE=True
+            ):
+                cache.clear()
+                with QueryCounter() as counter:
+                    response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(counter))
+        self.assertEqual(len(set(counts)), 1, counts)
+
+    def test_index(self):
+        self.assertQueryBudget(reverse('index'))
+
+    def test_group_posts(self):
+        self.assertQueryBudget(
+            reverse('group', kwargs={'slug': self.group.slug})
+        )
+
+    def test_profile(self):
+        self.assertQueryBudget(
+            reverse('profile', kwargs={'username': self.author.username})
+        )
+
+    def test_post_view(self):
+        self.assertQueryBudget(
+            reverse(
+                'post',
+                kwargs={
+                    'username': self.author.username,
+                    'post_id': self.post.pk
+                }
+            )
+        )
+
+    def test_follow_index(self):
+        self.assertQueryBudget(reverse('follow_index'))
+
+    def test_search(self):
+        self.assertQueryBudget(
+            reverse('search') + '?q=text&group={}&author={}'.format(
+                self.group.slug, self.author.username
+            )
+        )
+
+    def test_api(self):
+        post = {
+            'username': self.author.username, 'post_id': self.post.pk
+        }
+        for name, kwargs in (
+            ('api_index', {}),
+            ('api_follow_index', {}),
+            ('api_group', {'slug': self.group.slug}),
+            ('api_profile', {'username': self.author.username}),
+            ('api_post', post),
+            ('api_comments', post),
+        ):
+            with self.subTest(name):
+                self.assertQueryBudget(reverse(name, kwargs=kwargs))
+
+    def test_for_feed(self):
+        with self.assertNumQueries(1):
+            for post in Post.objects.for_feed()[:10]:
+                post.author.username, post.group.slug, post.comment_count
+
+    def test_query_plans(self):
+        out = StringIO()
+        index = generation('index')
+        call_command('check_query_plans', stdout=out, stderr=out)
+        self.assertIn('в порядке', out.getvalue())
+        # Временные данные не трогают настоящий кеш.
+        self.assertEqual(generation('index'), index)
+
+    @override_settings(QUERY_BUDGET_RAISE=True)
+    def test_budget_exceeded(self):
+        @query_budget(1)
+        def view(request):
+            Post.objects.count()
+            Post.objects.count()
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = QueryBudgetMiddleware(get_response)
+        with self.assertRaises(QueryBudgetExceeded):
+            middleware(RequestFactory().get('/'))
+        with QueryCounter() as counter:
+            view(None)
+        self.assertEqual(list(counter.duplicates().values()), [2])
+
+
+class TestPostCards(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345'
+        )
+        self.reader = User.objects.create_user(
+            username='t1000', email='t1000.s@skynet.com', password='54321'
+        )
+        self.post = Post.objects.create(author=self.author, text='Card')
+        self.client_author = Client()
+        self.client_author.force_login(self.author)
+        self.client_reader = Client()
+        self.client_reader.force_login(self.reader)
+        cache.clear()
+
+    def profile_url(self):
+        return reverse('profile', kwargs={'username': self.author.username})
+
+    def edit_url(self):
+        return reverse(
+            'post_edit',
+            kwargs={'username': self.author.username, 'post_id': self.post.pk}
+        )
+
+    def test_shared_card_with_viewer_actions(self):
+        response = self.client_reader.get(self.profile_url())
+        self.assertNotContains(response, self.edit_url())
+        self.assertIsNotNone(cache.get(card_key(self.post)))
+        response = self.client_author.get(self.profile_url())
+        self.assertContains(response, self.edit_url())
+
+    def test_version_bump(self):
+        self.client_reader.get(self.profile_url())
+        self.client_author.post(self.edit_url(), {'text': 'Card edited'})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.version, 1)
+        response = self.client_reader.get(self.profile_url())
+        self.assertContains(response, 'Card edited')
+        Comment.objects.create(post=self.post, author=self.reader, text='C')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.version, 2)
+        response = self.client_reader.get(self.profile_url())
+        self.assertContains(response, '1 комментариев')
+
+    def test_author_and_group_changes(self):
+        group = Group.objects.create(title='Old title', slug='old')
+        Post.objects.filter(pk=self.post.pk).update(group=group)
+        self.client_reader.get(reverse('index'))
+        self.author.username = 'sarah_connor'
+        self.author.save()
+        group.title = 'New title'
+        group.save()
+        response = self.client_reader.get(reverse('index'))
+        self.assertContains(response, '/sarah_connor/')
+        self.assertNotContains(response, '/sarah/')
+        self.assertContains(response, 'New title')
+
+
+class TestProfileHeader(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345'
+        )
+        self.author = User.objects.create_user(
+            username='t1000', email='t1000.s@skynet.com', password='54321'
+        )
+        self.client.force_login(self.user)
+        cache.clear()
+
+    def profile_url(self):
+        return reverse('profile', kwargs={'username': self.author.username})
+
+    def test_single_query(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        ProfilePhoto.objects.create(user=self.author, photo='users/a.jpg')
+        with self.assertNumQueries(1):
+            profile = get_profile(self.author.username, self.user)
+            self.assertTrue(profile.is_followed)
+            self.assertEqual(profile.avatar, 'users/a.jpg')
+            self.assertEqual(profile.stats.followers_count, 1)
+
+    def test_header_invalidation(self):
+        response = self.client.get(self.profile_url())
+        self.assertContains(response, 'Подписчиков: 0')
+        self.client.get(
+            reverse('profile_follow', kwargs={'username': 't1000'})
+        )
+        response = self.client.get(self.profile_url())
+        self.assertContains(response, 'Подписчиков: 1')
+        Post.objects.create(author=self.author, text='Text post 14')
+        response = self.client.get(self.profile_url())
+        self.assertContains(response, 'Записей: 1')
+
+    def test_edit_existing_photo(self):
+        ProfilePhoto.objects.create(user=self.user, photo='users/a.jpg')
+        response = self.client.get(
+            reverse('edit_photo', kwargs={'username': self.user.username})
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class TestThumbnails(TemporaryMedia, TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345'
+        )
+        img_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04'
+            b'\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
+            b'\x02\x4c\x01\x00\x3b'
+        )
+        self.img_gif = img_gif
+        self.post = Post.objects.create(
+            author=self.user, text='Thumbnail',
+            image=SimpleUploadedFile('thumb.gif', img_gif)
+        )
+        cache.clear()
+
+    def profile_url(self):
+        return reverse('profile', kwargs={'username': self.user.username})
+
+    def test_placeholder_until_ready(self):
+        self.assertIsNone(ready_thumbnails(self.post.image, 'post'))
+        response = self.client.get(self.profile_url())
+        self.assertContains(response, 'posts/placeholder.svg')
+        generate_post(self.post.pk)
+        thumbnail = ready_thumbnails(self.post.image, 'post')
+        self.assertIsNotNone(thumbnail)
+        response = self.client.get(self.profile_url())
+        self.assertContains(response, thumbnail.src.url)
+
+    def test_responsive_variants(self):
+        generate_post(self.post.pk)
+        thumbnail = ready_thumbnails(self.post.image, 'post')
+        self.assertEqual(thumbnail.srcset.count('w,'), 2)
+        self.assertIn(
+            '/media/', ' '.join(source['srcset'] for source in thumbnail.sources)
+        )
+        self.assertEqual(
+            [source['type'] for source in thumbnail.sources], ['image/webp']
+        )
+        self.assertEqual(len(variants('post')), 6)
+
+    @override_settings(THUMBNAIL_EAGER_CARDS=1)
+    def test_lazy_below_the_fold(self):
+        Post.objects.create(
+            author=self.user, text='Second',
+            image=SimpleUploadedFile('thumb.gif', self.img_gif)
+        )
+        response = self.client.get(self.profile_url())
+        self.assertContains(response, 'loading="lazy"', count=1)
+        self.assertIsNotNone(cache.get(card_key(self.post, lazy=True)))
+
+    def test_batched_lookups(self):
+        for i in range(3):
+            post = Post.objects.create(
+                author=self.user, text='Thumbnail {}'.format(i),
+                image=SimpleUploadedFile('thumb.gif', self.img_gif)
+            )
+            generate_post(post.pk)
+        cache.clear()
+        posts = prefetch_thumbnails(list(Post.objects.all()))
+        with self.assertNumQueries(1):
+            found = [post.thumbnail_batch.get(post) for post in posts]
+        # Одинаковые файлы хранятся один раз, так что готовы все четыре.
+        self.assertEqual(sum(thumbnail is not None for thumbnail in found), 4)
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response['X-Thumbnail-Lookups'], '1')
+        self.assertNotContains(response, 'posts/placeholder.svg')
+        # Карточки уже в кеше после главной, остаётся аватар.
+        response = self.client.get(self.profile_url())
+        self.assertEqual(response['X-Thumbnail-Lookups'], '1')
+        # Шапка тоже взята из кеша.
+        response = self.client.get(self.profile_url())
+        self.assertEqual(response['X-Thumbnail-Lookups'], '0')
+
+    def test_backfill_command(self):
+        index = generation('index')
+        call_command(
+            'generate_thumbnails', workers=1, stdout=StringIO(),
+            stderr=StringIO()
+        )
+        self.assertIsNotNone(ready_thumbnails(self.post.image, 'post'))
+        self.assertIsNotNone(
+            ready_thumbnails(settings.DEFAULT_AVATAR, 'avatar')
+        )
+        # Карточки и страницы, собранные с заглушками, пересобираются.
+        version = self.post.version
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.version, version + 1)
+        self.assertNotEqual(generation('index'), index)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class TestImageMetadata(TemporaryMedia, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345'
+        )
+        cache.clear()
+
+    def test_filled_on_upload(self):
+        img_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04'
+            b'\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
+            b'\x02\x4c\x01\x00\x3b'
+        )
+        post = Post.objects.create(
+            author=self.user, text='Metadata',
+            image=SimpleUploadedFile('meta.gif', img_gif)
+        )
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (1, 1))
+        self.assertEqual(post.image_size, len(img_gif))
+        self.assertRegex(post.image_color, r'^#[0-9a-f]{6}$')
+        response = self.client.get(
+            reverse('profile', kwargs={'username': self.user.username})
+        )
+        self.assertContains(response, post.image_color)
+
+    def test_backfill_command(self):
+        photo = ProfilePhoto.objects.create(
+            user=self.user, photo=settings.DEFAULT_AVATAR
+        )
+        self.assertIsNone(photo.photo_width)
+        call_command('fill_image_metadata', stdout=StringIO())
+        photo.refresh_from_db()
+        self.assertTrue(photo.photo_width and photo.photo_height)
+        self.assertIsNotNone(photo.photo_color)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class TestUploads(TemporaryMedia, TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345'
+        )
+        self.client.force_login(self.user)
+        cache.clear()
+
+    def jpeg(self, size, orientation=None):
+        from PIL import Image
+
+        image = Image.new('RGB', size, (200, 30, 30))
+        exif = Image.Exif()
+        if orientation:
+            exif[0x0112] = orientation
+        exif[0x010f] = 'Camera'
+        content = BytesIO()
+        image.save(content, 'JPEG', exif=exif.tobytes())
+        return SimpleUploadedFile('photo.jpg', content.getvalue())
+
+    def upload(self, image):
+        return self.client.post(
+            reverse('new_post'), {'text': 'upload', 'image': image}
+        )
+
+    @override_settings(IMAGE_MAX_DIMENSION=100)
+    def test_downscale_and_strip(self):
+        from PIL import Image
+
+        response = self.upload(self.jpeg((400, 200), orientation=6))
+        self.assertEqual(response.status_code, 302)
+        post = Post.objects.get()
+        self.assertEqual((post.image_width, post.image_height), (50, 100))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (50, 100))
+            self.assertEqual(len(image.getexif()), 0)
+
+    def test_animation_and_mpo_stripped(self):
+        from PIL import Image
+
+        frames = [Image.new('RGB', (8, 8), color) for color in ('red', 'blue')]
+        exif = Image.Exif()
+        exif[0x010f] = 'Camera'
+        for format_, name, extra in (
+            ('GIF', 'photo.gif', {'comment': b'Camera'}),
+            ('MPO', 'photo.jpg', {'exif': exif.tobytes()}),
+        ):
+            content = BytesIO()
+            frames[0].save(
+                content, format_, save_all=True, append_images=frames[1:],
+                duration=100, **extra
+            )
+            response = self.upload(
+                SimpleUploadedFile(name, content.getvalue())
+            )
+            self.assertEqual(response.status_code, 302)
+            post = Post.objects.latest('pk')
+            with post.image.open() as stored:
+                data = stored.read()
+            self.assertNotIn(b'Camera', data)
+            with Image.open(BytesIO(data)) as image:
+                frames_left = getattr(image, 'n_frames', 1)
+            self.assertEqual(frames_left, 2 if format_ == 'GIF' else 1)
+
+    def animation(self, size, count):
+        from PIL import Image
+
+        frames = [
+            Image.new('RGB', size, (i * 30, 0, 0)) for i in range(count)
+        ]
+        content = BytesIO()
+        frames[0].save(
+            content, 'GIF', save_all=True, append_images=frames[1:],
+            duration=100
+        )
+        return SimpleUploadedFile('animation.gif', content.getvalue())
+
+    @override_settings(IMAGE_MAX_DIMENSION=100)
+    def test_animation_downscaled(self):
+        from PIL import Image
+
+        response = self.upload(self.animation((400, 200), 3))
+        self.assertEqual(response.status_code, 302)
+        with Image.open(Post.objects.get().image.path) as image:
+            self.assertEqual((image.size, image.n_frames), ((100, 50), 3))
+
+    @override_settings(IMAGE_UPLOAD_MAX_ANIMATION_PIXELS=10 ** 6)
+    def test_animation_too_many_frames(self):
+        response = self.upload(self.animation((400, 400), 7))
+        self.assertFormError(
+            response, 'form', 'image',
+            'Анимация слишком большая, максимум 1 мегапикселей во всех кадрах.'
+        )
+        self.assertFalse(Post.objects.exists())
+
+    def test_csrf_still_checked(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post(
+            reverse('new_post'), {'text': 'upload', 'image': self.jpeg((4, 4))}
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Post.objects.exists())
+
+    def test_same_image_stored_once(self):
+        self.upload(self.jpeg((40, 20)))
+        self.upload(self.jpeg((40, 20)))
+        first, second = Post.objects.all()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^posts/[0-9a-f]{2}/[0-9a-f]{64}')
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=100)
+    def test_too_large(self):
+        response = self.upload(self.jpeg((400, 200)))
+        self.assertFormError(
+            response, 'form', 'image', 'Файл слишком большой, максимум 0 МБ.'
+        )
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=1000)
+    def test_too_many_pixels(self):
+        response = self.upload(self.jpeg((400, 200)))
+        self.assertFormError(
+            response, 'form', 'image',
+            'Изображение слишком большое, максимум 0 мегапикселей.'
+        )
+
+
+class TestMediaGarbage(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.root = directory.name
+        self.user = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345'
+        )
+        cache.clear()
+
+    def image(self, color):
+        from PIL import Image
+
+        content = BytesIO()
+        Image.new('RGB', (4, 4), color).save(content, 'PNG')
+        return SimpleUploadedFile('image.png', content.getvalue())
+
+    def files(self):
+        return sorted(
+            os.path.relpath(os.path.join(path, name), self.root)
+            for path, _, names in os.walk(self.root) for name in names
+        )
+
+    def test_collect(self):
+        live = Post.objects.create(
+            author=self.user, text='live', image=self.image('red')
+        )
+        dead = Post.objects.create(
+            author=self.user, text='dead', image=self.image('blue')
+        )
+        generate_post(live.pk)
+        generate_post(dead.pk)
+        dead.delete()
+        default_storage.save('users/orphan.png', self.image('green'))
+        before = self.files()
+
+        out = StringIO()
+        call_command(
+            'collect_media_garbage', dry_run=True, min_age=0, stdout=out
+        )
+        self.assertEqual(self.files(), before)
+        # Исходник, его миниатюры и посторонний файл в users/.
+        variants_count = len(variants('post'))
+        self.assertIn('Файлов: {}'.format(variants_count + 2), out.getvalue())
+
+        call_command('collect_media_garbage', min_age=0, stdout=StringIO())
+        after = self.files()
+        self.assertEqual(len(before) - len(after), variants_count + 2)
+        self.assertIn(live.image.name, after)
+        self.assertIsNotNone(ready_thumbnails(live.image, 'post'))
+        self.assertIsNone(ready_thumbnails(dead.image, 'post'))
+
+
+class TestSearch(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345'
+        )
+        self.other = User.objects.create_user(
+            username='t1000', email='t1000.s@skynet.com', password='54321'
+        )
+        self.group = Group.objects.create(
+            title='Test group', slug='test', description='Test group'
+        )
+        cache.clear()
+
+    def search(self, **params):
+        response = self.client.get(reverse('search'), params)
+        return [post.text for post in response.context['page']]
+
+    def test_index_follows_changes(self):
+        post = Post.objects.create(author=self.author, text='Терминатор')
+        self.assertEqual(self.search(q='термин'), ['Терминатор'])
+        post.text = 'Скайнет'
+        post.save()
+        self.assertEqual(self.search(q='термин'), [])
+        self.assertEqual(self.search(q='скайнет'), ['Скайнет'])
+        post.delete()
+        self.assertEqual(self.search(q='скайнет'), [])
+
+    def test_ranking_and_filters(self):
+        Post.objects.create(author=self.author, text='judgment day')
+        Post.objects.create(
+            author=self.other, group=self.group,
+            text='judgment judgment judgment'
+        )
+        self.assertEqual(
+            self.search(q='judgment'),
+            ['judgment judgment judgment', 'judgment day']
+        )
+        self.assertEqual(
+            self.search(q='judgment', group='test'),
+            ['judgment judgment judgment']
+        )
+        self.assertEqual(
+            self.search(q='judgment', author='sarah'), ['judgment day']
+        )
+        self.assertEqual(self.search(q='"*()'), [])
+
+    @override_settings(POSTS_PER_PAGE=2)
+    def test_keyset_pages(self):
+        for i in range(5):
+            Post.objects.create(author=self.author, text='skynet {}'.format(i))
+        seen = []
+        params = {'q': 'skynet'}
+        while True:
+            response = self.client.get(reverse('search'), params)
+            page = response.context['page']
+            seen.extend(post.pk for post in page)
+            if not page.has_next():
+                break
+            self.assertContains(response, 'q=skynet&amp;after=')
+            params['after'] = page.next_cursor()
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+        response = self.client.get(
+            reverse('search'), {'q': 'skynet', 'before': page.previous_cursor()}
+        )
+        self.assertEqual(len(response.context['page']), 2)
+
+    def test_admin_uses_index(self):
+        Post.objects.create(author=self.author, text='Терминатор')
+        Post.objects.create(author=self.author, text='Скайнет')
+        admin = User.objects.create_superuser('admin', 'a@a.com', 'admin')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'терминатор'}
+        )
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+
+class TestAutocomplete(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.sarah = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345',
+            first_name='Sarah', last_name='Connor'
+        )
+        self.sam = User.objects.create_user(
+            username='Sam', email='sam@skynet.com', password='12345'
+        )
+        self.skynet = User.objects.create_user(
+            username='skynet', email='skynet@skynet.com', password='12345'
+        )
+        self.group = Group.objects.create(
+            title='Salvation', slug='salvation', description='Test group'
+        )
+        cache.clear()
+
+    def values(self, prefix):
+        return [item['value'] for item in autocomplete.suggest(prefix)]
+
+    def test_ranked_by_followers(self):
+        Follow.objects.create(user=self.sarah, author=self.sam)
+        Follow.objects.create(user=self.skynet, author=self.sam)
+        Follow.objects.create(user=self.sam, author=self.sarah)
+        self.assertEqual(self.values('sa'), ['Sam', 'sarah', 'salvation'])
+        self.assertEqual(self.values('SAR'), ['sarah'])
+        self.assertEqual(self.values('t'), [])
+        self.assertEqual(self.values(''), [])
+
+    def test_incremental_updates(self):
+        self.assertEqual(self.values('sa'), ['salvation', 'Sam', 'sarah'])
+        index = autocomplete.get_index()
+
+        Post.objects.create(author=self.sarah, group=self.group, text='T')
+        Follow.objects.create(user=self.skynet, author=self.sarah)
+        User.objects.create_user(username='samantha', password='12345')
+        self.sam.username = 't800'
+        self.sam.save()
+        # Счёт обновится только при пересборке.
+        self.assertEqual(
+            self.values('sa'), ['salvation', 'samantha', 'sarah']
+        )
+        self.assertEqual(self.values('t8'), ['t800'])
+
+        self.skynet.is_active = False
+        self.skynet.save()
+        self.group.delete()
+        self.assertEqual(self.values('s'), ['samantha', 'sarah'])
+        self.assertIs(autocomplete.get_index(), index)
+
+    def test_scores_refreshed_on_rebuild(self):
+        self.values('sa')
+        Follow.objects.create(user=self.skynet, author=self.sarah)
+        self.assertEqual(self.values('sa'), ['salvation', 'Sam', 'sarah'])
+        index = autocomplete.get_index()
+        index.built -= settings.AUTOCOMPLETE_REBUILD_INTERVAL
+        self.assertEqual(self.values('sa'), ['sarah', 'salvation', 'Sam'])
+
+    def test_rebuild_when_log_lost(self):
+        self.values('sa')
+        index = autocomplete.get_index()
+        cache.clear()
+        User.objects.create_user(username='samantha', password='12345')
+        self.assertIn('samantha', self.values('sa'))
+        self.assertIsNot(autocomplete.get_index(), index)
+
+    def test_short_prefix_ranks_all_matches(self):
+        entries = [('user', pk, 'a%04d' % pk, '', 0) for pk in range(1500)]
+        entries.append(('user', 9999, 'azz', '', 10 ** 6))
+        index = autocomplete.PrefixIndex(entries, 0, top_size=3)
+
+        def values(prefix):
+            return [item['value'] for item in index.lookup(prefix, 3, 1000)]
+
+        self.assertEqual(values('a'), ['azz', 'a0000', 'a0001'])
+        self.assertEqual(values('az'), ['azz'])
+        index.upsert('user', 9999, 'bzz', '')
+        self.assertEqual(values('a'), ['a0000', 'a0001', 'a0002'])
+        self.assertEqual(values('b'), ['bzz'])
+        index.upsert('user', 1200, 'a1200', '')
+        index.remove('user', 0)
+        self.assertEqual(values('a'), ['a0001', 'a0002', 'a0003'])
+
+    def test_endpoint(self):
+        url = reverse('autocomplete')
+        self.client.get(url, {'q': 'sa'})
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'q': 'sa'})
+        self.assertEqual(response.json()['results'][0], {
+            'type': 'group', 'value': 'salvation', 'label': 'Salvation',
+            'score': 0, 'url': reverse('group', args=['salvation']),
+        })
+        results = self.client.get(url, {'q': 'sar'}).json()['results']
+        self.assertEqual(results[0]['label'], 'Sarah Connor')
+        self.assertEqual(results[0]['url'], reverse('profile', args=['sarah']))
+
+
+class TestApi(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345'
+        )
+        self.author = User.objects.create_user(
+            username='t1000', email='t1000.s@skynet.com', password='54321',
+            first_name='T', last_name='1000'
+        )
+        self.group = Group.objects.create(
+            title='Test group', slug='test', description='Test group'
+        )
+        self.posts = [
+            Post.objects.create(
+                author=self.author, group=self.group, text='Text %s' % i
+            )
+            for i in range(3)
+        ]
+        cache.clear()
+
+    @override_settings(POSTS_PER_PAGE=2)
+    def test_cursor_pages(self):
+        url = reverse('api_index')
+        first = self.client.get(url).json()
+        self.assertEqual(
+            [post['text'] for post in first['results']], ['Text 2', 'Text 1']
+        )
+        self.assertEqual(first['results'][0], {
+            'id': self.posts[2].pk, 'author': 't1000', 'group': 'test',
+            'text': 'Text 2', 'pub_date': self.posts[2].pub_date.isoformat(),
+            'comments': 0, 'image': None,
+        })
+        self.assertIsNone(first['previous'])
+        second = self.client.get(url, {'after': first['next']}).json()
+        self.assertEqual(
+            [post['text'] for post in second['results']], ['Text 0']
+        )
+        self.assertIsNone(second['next'])
+        back = self.client.get(url, {'before': second['previous']}).json()
+        self.assertEqual(back['results'], first['results'])
+
+    def test_conditional_get(self):
+        url = reverse('api_group', kwargs={'slug': 'test'})
+        response = self.client.get(url)
+        etag = response['ETag']
+        modified = response['Last-Modified']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, 304)
+
+        Comment.objects.create(
+            post=self.posts[0], author=self.user, text='Comment'
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['results'][2]['comments'], 1)
+
+    def test_feed_etag_after_rename(self):
+        url = reverse('api_index')
+        etag = self.client.get(url)['ETag']
+        self.author.username = 't800'
+        self.author.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['author'], 't800')
+        etag = response['ETag']
+        self.author.last_name = '800'
+        self.author.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_follow_feed(self):
+        url = reverse('api_follow_index')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_login(self.user)
+        response = self.client.get(url)
+        self.assertEqual(response.json()['results'], [])
+        Follow.objects.create(user=self.user, author=self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(len(response.json()['results']), 3)
+
+    def test_profile_post_and_comments(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        self.client.force_login(self.user)
+        profile = self.client.get(
+            reverse('api_profile', kwargs={'username': 't1000'})
+        ).json()['profile']
+        self.assertEqual(profile['name'], 'T 1000')
+        self.assertEqual(
+            (profile['posts'], profile['followers'], profile['is_followed']),
+            (3, 1, True)
+        )
+
+        kwargs = {'username': 't1000', 'post_id': self.posts[0].pk}
+        post = self.client.get(reverse('api_post', kwargs=kwargs)).json()
+        self.assertEqual(post['text'], 'Text 0')
+        for i in range(2):
+            Comment.objects.create(
+                post=self.posts[0], author=self.user, text='C%s' % i
+            )
+        with override_settings(POSTS_PER_PAGE=1):
+            url = reverse('api_comments', kwargs=kwargs)
+            page = self.client.get(url).json()
+            self.assertEqual(page['results'][0]['text'], 'C1')
+            page = self.client.get(url, {'after': page['next']}).json()
+            self.assertEqual(page['results'][0]['text'], 'C0')
+
+        # Смена имени автора и новый комментарий меняют ETag.
+        response = self.client.get(url)
+        etag = response['ETag']
+        post_etag = self.client.get(reverse('api_post', kwargs=kwargs))['ETag']
+        Comment.objects.create(post=self.posts[0], author=self.user, text='C2')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.author.first_name = 'Terminator'
+        self.author.save()
+        response = self.client.get(
+            reverse('api_post', kwargs=kwargs), HTTP_IF_NONE_MATCH=post_etag
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(
+            reverse('api_post', kwargs={'username': 'sarah', 'post_id': 1})
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'detail': 'Not found.'})
+        response = self.client.post(reverse('api_index'))
+        self.assertEqual(response.status_code, 405)
+
+
+class TestUsernameLookups(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345'
+        )
+        self.post = Post.objects.create(author=self.author, text='Text')
+        cache.clear()
+
+    def test_missing_usernames_are_cached(self):
+        url = reverse('profile', kwargs={'username': 'john'})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 404)
+        User.objects.create_user(username='john', password='12345')
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_rename(self):
+        self.client.get(reverse('profile', kwargs={'username': 'sarah'}))
+        self.author.username = 'connor'
+        self.author.save()
+        response = self.client.get(
+            reverse('profile', kwargs={'username': 'sarah'})
+        )
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(
+            reverse('profile', kwargs={'username': 'connor'})
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_lookup_verifies_author(self):
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                post = get_post_or_404(
+                    Post.objects.all(), 'sarah', self.post.pk
+                )
+                self.assertEqual(post.author.username, 'sarah')
+        User.objects.create_user(username='john', password='12345')
+        with self.assertRaises(Http404):
+            get_post_or_404(Post.objects.all(), 'john', self.post.pk)
+
+    def test_follow_without_user_query(self):
+        follower = User.objects.create_user(username='john', password='1')
+        self.client.force_login(follower)
+        self.client.get(reverse('profile', kwargs={'username': 'sarah'}))
+        with QueryCounter() as counter:
+            self.client.get(
+                reverse('profile_follow', kwargs={'username': 'sarah'})
+            )
+        self.assertFalse([
+            sql for sql in counter.queries
+            if sql.startswith('SELECT') and 'FROM "auth_user"' in sql
+        ])
+        self.assertTrue(
+            Follow.objects.filter(user=follower, author=self.author).exists()
+        )
@@ -0,0 +1,301 @@
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.templatetags.static import static
+from PIL import Image
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedKVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from yatube.routers import use_primary
+
+from . import cards
+from .caching import bump_generation
+from .models import Post, ProfilePhoto
+from .profiles import forget_header
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_lookups = threading.local()
+
+Variant = namedtuple('Variant', 'width format geometry options')
+PlaceholderFile = namedtuple('PlaceholderFile', 'url width height')
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails'
+        )
+    return _executor
+
+
+def _options(source, options):
+    # Те же значения по умолчанию, что подставляет
+    # ThumbnailBackend.get_thumbnail, иначе имя миниатюры не совпадёт.
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def _source(file_):
+    # Путь строкой (DEFAULT_AVATAR, файлы из команд) берётся из того же
+    # хранилища, что и поля моделей, иначе ключи sorl не совпадут.
+    if isinstance(file_, str):
+        return ImageFile(file_, default_storage)
+    return file_
+
+
+def thumbnail_file(file_, geometry, options):
+    """
+    Миниатюра, которую sorl построил бы для file_, без её построения.
+    """
+    source = ImageFile(_source(file_))
+    name = default.backend._get_thumbnail_filename(
+        source, geometry, _options(source, options)
+    )
+    return ImageFile(name, default.storage)
+
+
+def _formats():
+    # None - формат sorl по умолчанию, остальные только если Pillow
+    # умеет в них сохранять.
+    Image.init()
+    return [None] + [
+        format_ for format_ in settings.THUMBNAIL_EXTRA_FORMATS
+        if format_ in Image.SAVE
+    ]
+
+
+def variants(kind):
+    """
+    Варианты миниатюры kind по ширинам THUMBNAIL_WIDTHS и форматам.
+    Первый - основной: полная ширина в формате по умолчанию.
+    """
+    config = settings.THUMBNAIL_VARIANTS[kind]
+    width, height = config['size']
+    widths = sorted(
+        {w for w in settings.THUMBNAIL_WIDTHS if w < width} | {width},
+        reverse=True
+    )
+    result = []
+    for format_ in _formats():
+        options = dict(config['options'])
+        if format_ is not None:
+            options['format'] = format_
+        for w in widths:
+            geometry = '{}x{}'.format(w, round(height * w / width))
+            result.append(Variant(w, format_, geometry, options))
+    return result
+
+
+class Thumbnails:
+    """
+    Готовые варианты одного изображения для <picture>: основной src,
+    srcset в формате по умолчанию и <source> для остальных форматов.
+    """
+
+    def __init__(self, ready):
+        self.src = ready[0][1]
+        self.srcset = self._srcset(ready, None)
+        self.sources = [
+            {'type': 'image/' + format_.lower(),
+             'srcset': self._srcset(ready, format_)}
+            for format_ in _formats()[1:]
+            if any(variant.format == format_ for variant, _ in ready)
+        ]
+
+    @staticmethod
+    def _srcset(ready, format_):
+        return ', '.join(
+            '{} {}w'.format(file_.url, variant.width)
+            for variant, file_ in reversed(ready)
+            if variant.format == format_
+        )
+
+
+class Placeholder:
+    """
+    Заглушка того же размера, что основной вариант, пока миниатюра
+    не построена.
+    """
+    srcset = ''
+    sources = []
+
+    def __init__(self, kind):
+        width, height = settings.THUMBNAIL_VARIANTS[kind]['size']
+        self.src = PlaceholderFile(
+            static(settings.THUMBNAIL_PLACEHOLDER), width, height
+        )
+
+
+def lookup_count():
+    """
+    Сколько раз текущий поток обращался к хранилищу миниатюр sorl.
+    """
+    return getattr(_lookups, 'count', 0)
+
+
+def reset_lookup_count():
+    _lookups.count = 0
+
+
+def _count_lookup():
+    _lookups.count = lookup_count() + 1
+
+
+def ready_thumbnails(file_, kind):
+    """
+    Возвращает готовые варианты миниатюры (Thumbnails) или None, если
+    основной вариант ещё не построен. Изображение в потоке запроса
+    никогда не пережимается.
+    """
+    if not file_:
+        return None
+    return _resolve({None: file_}, kind)[None]
+
+
+def _get_many(keys):
+    # Одно чтение кеша и не больше одного запроса к базе для промахов,
+    # с тем же кешированием пустых ответов, что у cached_db KVStore.
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedKVStore):
+        found = {key: kvstore._get(key) for key in keys}
+        return {key: value for key, value in found.items() if value}
+    prefixed = {add_prefix(key): key for key in keys}
+    values = kvstore.cache.get_many(list(prefixed))
+    missing = [key for key in prefixed if key not in values]
+    if missing:
+        stored = dict(
+            KVStoreModel.objects.filter(
+                key__in=missing
+            ).values_list('key', 'value')
+        )
+        fetched = {key: stored.get(key, EMPTY_VALUE) for key in missing}
+        kvstore.cache.set_many(
+            fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT
+        )
+        values.update(fetched)
+    return {
+        prefixed[key]: deserialize_image_file(value)
+        for key, value in values.items() if value is not EMPTY_VALUE
+    }
+
+
+def _resolve(images, kind):
+    # Все варианты всех изображений читаются одним обращением.
+    found = {}
+    if not images:
+        return found
+    files = {
+        key: [
+            (variant, thumbnail_file(image, variant.geometry, variant.options))
+            for variant in variants(kind)
+        ]
+        for key, image in images.items()
+    }
+    _count_lookup()
+    stored = _get_many([
+        file_.key for candidates in files.values() for _, file_ in candidates
+    ])
+    for key, candidates in files.items():
+        ready = [
+            (variant, stored[file_.key])
+            for variant, file_ in candidates if file_.key in stored
+        ]
+        main = candidates[0][1].key
+        found[key] = Thumbnails(ready) if main in stored else None
+    return found
+
+
+class ThumbnailBatch:
+    """
+    Готовые миниатюры записей одной страницы. Хранилище sorl читается
+    один раз за всю страницу и только если хоть одна карточка
+    отрисовывается заново, а не берётся из кеша.
+    """
+
+    def __init__(self, posts, kind='post'):
+        self.images = {post.pk: post.image for post in posts if post.image}
+        self.kind = kind
+        self._found = None
+
+    def get(self, post):
+        if self._found is None:
+            self._found = _resolve(self.images, self.kind)
+        return self._found.get(post.pk)
+
+
+def prefetch_thumbnails(posts, kind='post'):
+    """
+    Привязывает к записям страницы общий ThumbnailBatch, через который
+    их миниатюры находит тег post_thumbnail.
+    """
+    batch = ThumbnailBatch(posts, kind)
+    for post in posts:
+        post.thumbnail_batch = batch
+    return posts
+
+
+def generate(file_, kind):
+    for variant in variants(kind):
+        get_thumbnail(_source(file_), variant.geometry, **variant.options)
+
+
+def _run(job, *args):
+    try:
+        # Задача ставится сразу после записи, реплика может отставать.
+        with use_primary():
+            job(*args)
+    except Exception:
+        logger.exception('Thumbnail job %s%s failed', job.__name__, args)
+    finally:
+        close_old_connections()
+
+
+def generate_post(post_id):
+    post = Post.objects.filter(pk=post_id).only('image').first()
+    if post is None or not post.image:
+        return
+    generate(post.image, 'post')
+    # Карточки с заглушкой вместо картинки нужно перерисовать.
+    cards.bump(post_id)
+    bump_generation('index')
+
+
+def generate_avatar(photo_id):
+    photo = ProfilePhoto.objects.filter(pk=photo_id).first()
+    if photo is None or not photo.photo:
+        return
+    generate(photo.photo, 'avatar')
+    forget_header(photo.user_id)
+
+
+def schedule(job, *args):
+    """
+    Ставит построение миниатюр в фоновый пул после фиксации транзакции.
+    """
+    transaction.on_commit(
+        lambda: _get_executor().submit(_run, job, *args)
+    )
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.db.models import F
+
+from .models import Follow, Post, TimelineEntry, UserStats
+
+# Поля, по которым листается лента подписок: у обоих источников они
+# называются одинаково, у материализованной ленты это столбцы
+# TimelineEntry, покрытые индексом.
+FEED_FIELD = 'feed_date'
+FEED_KEY = 'feed_pk'
+
+
+def _bulk_add(entries):
+    TimelineEntry.objects.bulk_create(
+        entries,
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def is_popular(author_id):
+    return UserStats.objects.filter(
+        user=author_id,
+        followers_count__gt=settings.TIMELINE_FANOUT_LIMIT
+    ).exists()
+
+
+def fan_out(post):
+    """
+    Раскладывает новую запись по лентам подписчиков автора.
+    Записи популярных авторов не раскладываются, а читаются слиянием.
+    """
+    if is_popular(post.author_id):
+        Post.objects.filter(pk=post.pk).update(fanned_out=False)
+        post.fanned_out = False
+        return
+    followers = Follow.objects.filter(
+        author=post.author_id
+    ).values_list('user_id', flat=True)
+    _bulk_add(
+        TimelineEntry(user_id=user_id, post_id=post.pk, pub_date=post.pub_date)
+        for user_id in followers.iterator()
+    )
+
+
+def backfill(user_id, author_id):
+    """
+    Добавляет в ленту подписчика последние TIMELINE_BACKFILL_LIMIT
+    разложенных записей автора.
+    """
+    posts = Post.objects.filter(
+        author=author_id, fanned_out=True
+    ).order_by('-pub_date', '-pk').values_list('pk', 'pub_date')
+    _bulk_add(
+        TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for post_id, pub_date in posts[:settings.TIMELINE_BACKFILL_LIMIT]
+    )
+
+
+def trim(user_id, author_id):
+    TimelineEntry.objects.filter(
+        user=user_id, post__author=author_id
+    ).delete()
+
+
+def timeline_sources(user):
+    """
+    Источники ленты подписок: материализованная лента и
+    записи популярных авторов, которые сливаются при чтении.
+    Листать их нужно по FEED_FIELD и FEED_KEY.
+    """
+    posts = Post.objects.for_feed()
+    return [
+        posts.filter(timeline__user=user).annotate(
+            feed_date=F('timeline__pub_date'), feed_pk=F('timeline__post')
+        ),
+        posts.filter(fanned_out=False, author__following__user=user).annotate(
+            feed_date=F('pub_date'), feed_pk=F('pk')
+        ),
+    ]
@@ -0,0 +1,278 @@
+"""
+Потоковый приём изображений. Обработчик смотрит на заголовок файла по
+мере поступления данных и отбрасывает не-изображения, слишком тяжёлые
+файлы и слишком большие по числу пикселей снимки, не дочитывая их.
+Принятое изображение поворачивается по EXIF, уменьшается до
+IMAGE_MAX_DIMENSION и пересохраняется без метаданных.
+
+Обработчик ставится только представлениям с загрузкой изображений
+(декоратор image_uploads), остальные запросы идут через обработчики
+Django по умолчанию.
+"""
+from functools import wraps
+from itertools import islice
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image, ImageOps, ImageSequence
+
+# Начала файлов допустимых форматов.
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+    (b'RIFF', 'WEBP'),
+)
+# Сколько байт начала файла читать в поисках размеров изображения.
+HEADER_LIMIT = 256 * 1024
+# Что из info кадра анимации сохраняется при пересохранении, остальное
+# (EXIF, XMP, комментарии) отбрасывается.
+FRAME_INFO = ('transparency', 'background')
+
+
+def _sniff(header):
+    for signature, format_ in SIGNATURES:
+        if header.startswith(signature):
+            if format_ == 'WEBP' and header[8:12] != b'WEBP':
+                return None
+            return format_
+    return None
+
+
+class UploadRejected(Exception):
+    """
+    normalize() отказывается принимать изображение. code - ключ
+    сообщения ImageUploadField.
+    """
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+class RejectedUpload(UploadedFile):
+    """
+    Файл, отброшенный при приёме. code - ключ сообщения ImageUploadField.
+    """
+
+    def __init__(self, name, code):
+        super().__init__(BytesIO(), name, None, 0)
+        self.code = code
+
+
+class ImageUploadHandler(FileUploadHandler):
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        self.request_length = content_length
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = None
+        self.header = b''
+        self.rejected = None
+        self.size = 0
+        declared = self.content_length or getattr(self, 'request_length', 0)
+        if declared and declared > settings.IMAGE_UPLOAD_MAX_SIZE + (
+            settings.DATA_UPLOAD_MAX_MEMORY_SIZE or 0
+        ):
+            # Тело запроса заведомо больше допустимого: файл даже не
+            # начинаем сохранять.
+            self.reject('too_large')
+
+    def reject(self, code):
+        self.rejected = code
+        self.header = b''
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.rejected:
+            return None
+        self.size += len(raw_data)
+        if self.size > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.reject('too_large')
+            return None
+        if self.file is None:
+            self.check_header(raw_data)
+        else:
+            self.file.write(raw_data)
+        return None
+
+    def check_header(self, raw_data):
+        # Данные копятся в памяти, пока по заголовку не станут известны
+        # формат и размеры, но не больше HEADER_LIMIT байт.
+        self.header += raw_data
+        if len(self.header) >= 12 and _sniff(self.header) is None:
+            self.reject('invalid_image')
+            return
+        try:
+            with Image.open(BytesIO(self.header)) as image:
+                width, height = image.size
+        except Exception:
+            if len(self.header) >= HEADER_LIMIT:
+                self.reject('invalid_image')
+            return
+        if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+            self.reject('too_many_pixels')
+            return
+        self.file = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        self.file.write(self.header)
+        self.header = b''
+
+    def file_complete(self, file_size):
+        if self.rejected:
+            return RejectedUpload(self.file_name, self.rejected)
+        if self.file is None:
+            # Файл кончился раньше, чем стал понятен заголовок.
+            return RejectedUpload(self.file_name, 'invalid_image')
+        try:
+            content = normalize(self.file)
+        except UploadRejected as error:
+            return RejectedUpload(self.file_name, error.code)
+        except Exception:
+            return RejectedUpload(self.file_name, 'invalid_image')
+        content.seek(0, 2)
+        size = content.tell()
+        content.seek(0)
+        return UploadedFile(
+            content, self.file_name, self.content_type, size, self.charset,
+            self.content_type_extra
+        )
+
+
+def image_uploads(view):
+    """
+    Принимает файлы запроса через ImageUploadHandler. Обработчик нужно
+    поставить до того, как CsrfViewMiddleware прочитает тело запроса,
+    поэтому CSRF проверяется уже внутри.
+    """
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers = [ImageUploadHandler(request)]
+        return protected(request, *args, **kwargs)
+    return wrapper
+
+
+def _new_content():
+    return SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+
+
+def _frame(frame, limit):
+    copy = frame.copy()
+    copy.thumbnail((limit, limit), Image.LANCZOS)
+    copy.info = {
+        key: value for key, value in frame.info.items() if key in FRAME_INFO
+    }
+    return copy
+
+
+def _strip_frames(image, format_, limit):
+    # Кадры уменьшаются и пересохраняются без метаданных по одному:
+    # остальные кадры отдаются генератором, а не копятся списком.
+    width, height = image.size
+    if image.n_frames * width * height > (
+        settings.IMAGE_UPLOAD_MAX_ANIMATION_PIXELS
+    ):
+        raise UploadRejected('too_many_frames')
+    durations = [
+        frame.info.get('duration', 0)
+        for frame in ImageSequence.Iterator(image)
+    ]
+    image.seek(0)
+    first = _frame(image, limit)
+    rest = (
+        _frame(frame, limit)
+        for frame in islice(ImageSequence.Iterator(image), 1, None)
+    )
+    content = _new_content()
+    first.save(
+        content, format_, save_all=True, append_images=rest,
+        duration=durations, loop=image.info.get('loop', 0)
+    )
+    return content
+
+
+def normalize(source):
+    """
+    Поворачивает изображение по EXIF, уменьшает до IMAGE_MAX_DIMENSION
+    и пересохраняет без метаданных, анимации - кадр за кадром. Из MPO
+    остаётся первый кадр.
+    """
+    source.seek(0)
+    limit = settings.IMAGE_MAX_DIMENSION
+    with Image.open(source) as image:
+        format_ = image.format
+        if format_ == 'MPO':
+            # Остальные кадры MPO (стерео, карта глубины) несут те же
+            # EXIF и GPS, а показывается только первый.
+            format_ = 'JPEG'
+        elif getattr(image, 'is_animated', False):
+            content = _strip_frames(image, format_, limit)
+            source.close()
+            return content
+        icc_profile = image.info.get('icc_profile')
+        # JPEG сразу декодируется в уменьшенном масштабе.
+        image.draft('RGB', (limit, limit))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((limit, limit), Image.LANCZOS)
+        params = {}
+        if icc_profile:
+            params['icc_profile'] = icc_profile
+        if format_ == 'JPEG':
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            params.update(
+                quality=settings.IMAGE_UPLOAD_QUALITY, optimize=True
+            )
+        elif format_ == 'WEBP':
+            params['quality'] = settings.IMAGE_UPLOAD_QUALITY
+        content = _new_content()
+        image.save(content, format_, **params)
+    source.close()
+    return content
+
+
+class ImageUploadField(forms.ImageField):
+    """
+    Поле изображения, которое показывает, почему ImageUploadHandler
+    отбросил файл.
+    """
+    default_error_messages = {
+        'too_large': 'Файл слишком большой, максимум %(limit)s МБ.',
+        'too_many_pixels': (
+            'Изображение слишком большое, максимум %(limit)s мегапикселей.'
+        ),
+        'too_many_frames': (
+            'Анимация слишком большая, максимум %(limit)s мегапикселей '
+            'во всех кадрах.'
+        ),
+    }
+
+    def to_python(self, data):
+        if isinstance(data, RejectedUpload):
+            limits = {
+                'too_large': settings.IMAGE_UPLOAD_MAX_SIZE // 2 ** 20,
+                'too_many_pixels': settings.IMAGE_UPLOAD_MAX_PIXELS // 10 ** 6,
+                'too_many_frames': (
+                    settings.IMAGE_UPLOAD_MAX_ANIMATION_PIXELS // 10 ** 6
+                ),
+            }
+            raise ValidationError(
+                self.error_messages[data.code],
+                code=data.code,
+                params={'limit': limits.get(data.code)},
+            )
+        return super().to_python(data)
@@ -1,10 +1,27 @@
 from django.urls import include, path
 
-from . import views
+from . import api, views
+
+api_urlpatterns = [
+    path('posts/', api.index, name='api_index'),
+    path('follow/', api.follow_index, name='api_follow_index'),
+    path('group/<slug:slug>/', api.group_posts, name='api_group'),
+    path('<str:username>/', api.profile, name='api_profile'),
+    path('<str:username>/<int:post_id>/', api.post_view, name='api_post'),
+    path(
+        '<str:username>/<int:post_id>/comments/',
+        api.comments,
+        name='api_comments'
+    ),
+]
 
 urlpatterns = [
+    path('api/', include(api_urlpatterns)),
     path('', views.index, name="index"),
     path('follow/', views.follow_index, name='follow_index'),
+    path('cache-stats/', views.cache_stats, name='cache_stats'),
+    path('search/', views.search, name='search'),
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
     path('<str:username>/follow/', views.profile_follow, name='profile_follow'), 
     path('<str:username>/unfollow/', views.profile_unfollow, name='profile_unfollow'),
     path('group/<slug:slug>/', views.group_posts, name="group"),
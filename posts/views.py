@@ -1,26 +1,34 @@
-import os
-
-from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 from django.urls import reverse
-from django.http import request
-
-from .forms import PostForm, CommentForm, ProfilePhotoForm
+from django.http import JsonResponse, request
+from django.utils.http import urlencode
+
+from .autocomplete import suggest
+from .caching import cached_page, page_cache_stats
+from .forms import PostForm, CommentForm, ProfilePhotoForm, SearchForm
+from .lookups import get_post_or_404, resolve_username
+from .middleware import query_budget
 from .models import Group, Post, Comment, Follow, ProfilePhoto
-
-User = get_user_model()
-
-
-@cache_page(20,  key_prefix='index_page')
+from .paginator import paginate
+from .profiles import get_profile, render_header
+from .search import SearchPaginator
+from .thumbnails import (
+    generate_avatar, generate_post, prefetch_thumbnails, schedule
+)
+from .timeline import FEED_FIELD, FEED_KEY, timeline_sources
+from .uploads import image_uploads
+
+
+@cached_page('index', settings.INDEX_CACHE_TIMEOUT)
+@query_budget(3)
 def index(request):
-    post_list = Post.objects.order_by('-pub_date').all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = Post.objects.for_feed()
+    page, paginator = paginate(request, post_list)
+    prefetch_thumbnails(page)
     return render(
         request,
         'index.html',
@@ -28,12 +36,12 @@ def index(request):
     )
 
 
+@query_budget(4)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.order_by('-pub_date')
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = group.posts.for_feed()
+    page, paginator = paginate(request, post_list)
+    prefetch_thumbnails(page)
     return render(
         request,
         'group.html',
@@ -41,7 +49,43 @@ def group_posts(request, slug):
     )
 
 
+@query_budget(4)
+def search(request):
+    form = SearchForm(request.GET or None)
+    page = None
+    params = ''
+    if form.is_valid():
+        query = {
+            key: value for key, value in form.cleaned_data.items() if value
+        }
+        paginator = SearchPaginator(
+            query['q'], settings.POSTS_PER_PAGE,
+            group=query.get('group'), author=query.get('author')
+        )
+        page = paginator.get_page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
+        prefetch_thumbnails(page)
+        params = urlencode(query)
+    return render(
+        request,
+        'posts/search.html',
+        {'form': form, 'page': page, 'params': params}
+    )
+
+
+@query_budget(2)
+def autocomplete(request):
+    results = suggest(request.GET.get('q', '').strip())
+    for item in results:
+        view = 'profile' if item['type'] == 'user' else 'group'
+        item['url'] = reverse(view, args=[item['value']])
+    return JsonResponse({'results': results})
+
+
 @login_required
+@image_uploads
 def new_post(request):
     post_exists = False
 
@@ -56,6 +100,8 @@ def new_post(request):
     post = form.save(commit=False)
     post.author = request.user
     post.save()
+    if post.image:
+        schedule(generate_post, post.pk)
 
     return redirect(
         reverse(
@@ -67,81 +113,53 @@ def new_post(request):
     )
 
 
+@query_budget(5)
 def profile(request, username):
-    profile = get_object_or_404(User, username=username)
-    
-    if ProfilePhoto.objects.filter(user=profile).exists():
-        photo = ProfilePhoto.objects.get(user=profile).photo
-    else:
-        photo = os.path.abspath('media/profile.jpg')
-    
-    post_list = profile.posts.order_by('-pub_date')
-    post_amount = post_list.count()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    follows_count = profile.follower.count()
-    followers_count = profile.following.count()
-    following = False
-
-    if request.user.is_authenticated:
-        if Follow.objects.filter(
-            user=request.user, 
-            author=profile
-        ).exists(): 
-            following = True
+    profile = get_profile(username, request.user)
+    post_list = profile.posts.for_feed()
+    page, paginator = paginate(request, post_list)
+    prefetch_thumbnails(page)
 
     return render(
         request,
         'posts/profile.html',
         {
             'profile': profile,
+            'header': render_header(profile),
             'paginator': paginator,
             'page': page,
-            'amount': post_amount,
-            'following': following,
-            'follows': follows_count,
-            'followers': followers_count,
-            'photo': photo
+            'following': profile.is_followed,
         }
     )
 
 
+@query_budget(6)
 def post_view(request, username, post_id):
-    profile = get_object_or_404(User, username=username)
-
-    if ProfilePhoto.objects.filter(user=profile).exists():
-        photo = ProfilePhoto.objects.get(user=profile).photo
-    else:
-        photo = os.path.abspath('media/profile.jpg')
-
-    post = get_object_or_404(Post, pk=post_id, author=profile)
-    post_amount = profile.posts.count()
+    profile = get_profile(username, request.user)
+    post = get_object_or_404(
+        Post.objects.for_feed(), pk=post_id, author=profile
+    )
     form = CommentForm()
-    comments = post.comments.order_by('-created')
-    follows_count = profile.follower.count()
-    followers_count = profile.following.count()
+    comments = post.comments.select_related('author').order_by('-created')
 
     return render(
         request,
         'posts/post.html',
         {
             'profile': profile,
+            'header': render_header(profile),
             'post': post,
-            'amount': post_amount,
             'items': comments,
             'form': form,
-            'follows': follows_count,
-            'followers': followers_count,
-            'photo': photo
         }
     )
 
 
 @login_required
+@image_uploads
 def post_edit(request, username, post_id):
-    profile = get_object_or_404(User, username=username)
-    post = get_object_or_404(Post, pk=post_id, author=profile)
+    post = get_post_or_404(Post.objects.all(), username, post_id)
+    profile = post.author
 
     if request.user != post.author:
         return redirect('post', username=profile, post_id=post.pk)
@@ -158,14 +176,15 @@ def post_edit(request, username, post_id):
         )
 
     form.save()
+    if 'image' in form.changed_data and post.image:
+        schedule(generate_post, post.pk)
 
     return redirect('post', username=profile, post_id=post.pk)
 
 
 @login_required
 def post_delete(request, username, post_id):
-    profile = get_object_or_404(User, username=username)
-    post = get_object_or_404(Post, pk=post_id, author=profile)
+    post = get_post_or_404(Post.objects.all(), username, post_id)
 
     if request.user != post.author:
         return redirect('index')
@@ -190,8 +209,7 @@ def server_error(request):
 
 @login_required
 def add_comment(request, username, post_id):
-    profile = get_object_or_404(User, username=username)
-    post = get_object_or_404(Post, pk=post_id, author=profile)
+    post = get_post_or_404(Post.objects.all(), username, post_id)
     form = CommentForm(request.POST or None)
 
     if not form.is_valid():
@@ -218,11 +236,11 @@ def add_comment(request, username, post_id):
 
 
 @login_required
+@query_budget(4)
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user).order_by('-pub_date')
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = timeline_sources(request.user)
+    page, paginator = paginate(request, post_list, FEED_FIELD, FEED_KEY)
+    prefetch_thumbnails(page)
     return render(
         request,
         'posts/follow.html',
@@ -238,14 +256,14 @@ def profile_follow(request, username):
             'username': username,
         }
     )
-    author = get_object_or_404(User, username=username)
-    if request.user == author:
+    author_id = resolve_username(username)
+    if request.user.pk == author_id:
         return redirect(
             url
         )
     Follow.objects.get_or_create(
         user=request.user,
-        author=author
+        author_id=author_id
     )
     return redirect(
         url
@@ -254,7 +272,7 @@ def profile_follow(request, username):
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
+    author_id = resolve_username(username)
     url = reverse(
         'profile',
         kwargs={
@@ -263,7 +281,7 @@ def profile_unfollow(request, username):
     )
     Follow.objects.filter(
         user=request.user,
-        author=author
+        author=author_id
     ).delete()
 
     return redirect(
@@ -272,17 +290,13 @@ def profile_unfollow(request, username):
 
 
 @login_required
+@image_uploads
 def edit_photo(request, username):
-    profile = get_object_or_404(User, username=username)
-
-    if ProfilePhoto.objects.filter(user=profile).exists():
-        photo = ProfilePhoto.objects.get(user=profile).photo
-    else:
-        photo = None 
-
-    if request.user != profile:
-        return redirect('profile', username=profile)
+    if request.user.pk != resolve_username(username):
+        return redirect('profile', username=username)
+    profile = request.user
 
+    photo = ProfilePhoto.objects.filter(user=profile).first()
     form = ProfilePhotoForm(request.POST or None, files=request.FILES or None, instance=photo)
 
     if not form.is_valid():
@@ -292,14 +306,15 @@ def edit_photo(request, username):
             {'form': form, 'profile': profile}
         )
 
-    try:
-        photo = ProfilePhoto.objects.get(user=profile)
-        photo.delete()
-    except:
-        photo = None
-
     photo = form.save(commit=False)
     photo.user = request.user
     photo.save()
+    if 'photo' in form.changed_data and photo.photo:
+        schedule(generate_avatar, photo.pk)
 
     return redirect('profile', username=profile)
+
+
+@staff_member_required
+def cache_stats(request):
+    return JsonResponse({'index': page_cache_stats('index')})
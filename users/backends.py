@@ -0,0 +1,49 @@
+"""
+Пользователь для AuthenticationMiddleware берётся из кеша, а не из
+auth_user. Запись в кеше обновляется при каждом сохранении
+пользователя (вход меняет last_login, смена пароля - password),
+поэтому хеш сессии сверяется с актуальным паролем.
+
+Каждый запрос получает свой экземпляр пользователя: кеши прав
+(_perm_cache и другие) и связей не переходят в другие запросы и потоки.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+
+def user_key(user_id):
+    return 'auth_user:{}'.format(user_id)
+
+
+def _clean_copy(user):
+    # Новый экземпляр без накопленных кешей прав (_perm_cache,
+    # _user_perm_cache, _group_perm_cache) и связей (fields_cache).
+    model = type(user)
+    fields = [field.attname for field in model._meta.concrete_fields]
+    return model.from_db(
+        user._state.db, fields, [getattr(user, name) for name in fields]
+    )
+
+
+def remember_user(user):
+    cache.set(
+        user_key(user.pk), _clean_copy(user), settings.USER_CACHE_TIMEOUT
+    )
+
+
+def forget_user(user_id):
+    cache.delete(user_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        user = cache.get(user_key(user_id))
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                remember_user(user)
+            return user
+        if not self.user_can_authenticate(user):
+            return None
+        return _clean_copy(user)
@@ -0,0 +1,25 @@
+from django.contrib.auth import BACKEND_SESSION_KEY
+
+# Бэкенды, которые раньше стояли в AUTHENTICATION_BACKENDS. Сессии,
+# созданные с ними, django.contrib.auth.get_user отклоняет.
+RENAMED_BACKENDS = {
+    'django.contrib.auth.backends.ModelBackend':
+        'users.backends.CachedModelBackend',
+}
+
+
+class RenamedBackendMiddleware:
+    """
+    Переписывает в сессии путь к бэкенду, с которым вошёл пользователь,
+    если бэкенд заменён, чтобы замена не разлогинила всех. Работает и с
+    сессиями в подписанной cookie, которые не перепишешь в базе.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        backend = request.session.get(BACKEND_SESSION_KEY)
+        if backend in RENAMED_BACKENDS:
+            request.session[BACKEND_SESSION_KEY] = RENAMED_BACKENDS[backend]
+        return self.get_response(request)
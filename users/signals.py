@@ -0,0 +1,38 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .backends import forget_user, remember_user
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        remember_user(instance)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def permissions_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    # Права считаются по группам и разрешениям пользователя, поэтому
+    # закешированный пользователь забывается вместе с ними.
+    if not reverse:
+        if action.startswith('post_'):
+            forget_user(instance.pk)
+        return
+    if action == 'pre_clear':
+        users = list(instance.user_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        users = pk_set
+    else:
+        return
+    for user_id in users:
+        forget_user(user_id)
@@ -1,3 +1,106 @@
-from django.test import TestCase
+import re
 
-# Create your tests here.
+from django.contrib.auth import BACKEND_SESSION_KEY, get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.middleware import QueryCounter
+
+from .backends import CachedModelBackend, user_key
+
+User = get_user_model()
+
+# Запросы, которые читают сессию или пользователя запроса.
+AUTH_QUERY = re.compile(r'FROM "(django_session|auth_user)"')
+
+
+class TestCachedAuth(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345'
+        )
+        cache.clear()
+        self.client.login(username='sarah', password='12345')
+
+    def auth_queries(self, url):
+        with QueryCounter() as counter:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.wsgi_request.user.is_authenticated)
+        return [sql for sql in counter.queries if AUTH_QUERY.search(sql)]
+
+    def test_no_auth_queries(self):
+        url = reverse('follow_index')
+        self.client.get(url)
+        self.assertEqual(self.auth_queries(url), [])
+
+    @override_settings(
+        SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies'
+    )
+    def test_signed_cookie_sessions(self):
+        self.client.login(username='sarah', password='12345')
+        url = reverse('follow_index')
+        self.client.get(url)
+        self.assertEqual(self.auth_queries(url), [])
+
+    def test_write_through(self):
+        url = reverse('follow_index')
+        self.client.get(url)
+        self.user.first_name = 'Sarah'
+        self.user.save()
+        self.assertEqual(cache.get(user_key(self.user.pk)).first_name, 'Sarah')
+
+        # После смены пароля старая сессия больше не действует.
+        self.user.set_password('54321')
+        self.user.save()
+        response = self.client.get(url)
+        self.assertRedirects(response, '/auth/login/?next=' + url)
+
+    def test_session_with_old_backend(self):
+        session = self.client.session
+        session[BACKEND_SESSION_KEY] = (
+            'django.contrib.auth.backends.ModelBackend'
+        )
+        session.save()
+        url = reverse('follow_index')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(
+            self.client.session[BACKEND_SESSION_KEY],
+            'users.backends.CachedModelBackend'
+        )
+
+    def test_inactive_and_deleted(self):
+        url = reverse('follow_index')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.user.delete()
+        self.assertIsNone(cache.get(user_key(self.user.pk)))
+
+    def test_fresh_copy_per_request(self):
+        backend = CachedModelBackend()
+        first = backend.get_user(self.user.pk)
+        self.assertFalse(first.has_perm('auth.view_group'))
+        second = backend.get_user(self.user.pk)
+        self.assertIsNot(first, second)
+        self.assertFalse(hasattr(second, '_perm_cache'))
+        self.assertEqual(second._state.fields_cache, {})
+
+    def test_permissions_forget_user(self):
+        backend = CachedModelBackend()
+        group = Group.objects.create(name='resistance')
+        permission = Permission.objects.get(
+            content_type__app_label='auth', codename='view_group'
+        )
+        backend.get_user(self.user.pk)
+        self.user.groups.add(group)
+        self.assertIsNone(cache.get(user_key(self.user.pk)))
+        backend.get_user(self.user.pk)
+        self.user.user_permissions.add(permission)
+        self.assertIsNone(cache.get(user_key(self.user.pk)))
+        backend.get_user(self.user.pk)
+        group.user_set.clear()
+        self.assertIsNone(cache.get(user_key(self.user.pk)))
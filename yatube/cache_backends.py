@@ -0,0 +1,277 @@
+"""
+Двухуровневый кеш: небольшой LRU в памяти процесса (L1) перед общим
+для всех процессов хранилищем SQLite на локальном диске (L2).
+
+Каждая запись L2 хранит штамп версии, который меняется при любой
+записи или удалении ключа. Запись L1 отдаётся без обращения к L2 не
+дольше SYNC_INTERVAL секунд, после чего её штамп сверяется с L2. Так
+изменение в одном процессе доходит до остальных за SYNC_INTERVAL.
+
+L1 хранит значения в pickle, как и L2: каждый get получает свою копию,
+и запросы и потоки процесса не делят один изменяемый объект.
+"""
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    stamp INTEGER NOT NULL
+)
+'''
+
+# Доля записей в L2, после которых удаляются истёкшие и лишние строки.
+CULL_PROBABILITY = 0.01
+# Сколько ключей get_many читает из L2 одним запросом.
+BATCH_SIZE = 500
+
+
+def _new_stamp():
+    return random.getrandbits(62)
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self._sync_interval = float(options.get('SYNC_INTERVAL', 1))
+        self._l1 = OrderedDict()
+        self._l1_lock = threading.Lock()
+        self._local = threading.local()
+
+    # L2
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path, timeout=10, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def _cull(self, connection):
+        if random.random() >= CULL_PROBABILITY:
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?',
+            (time.time(),)
+        )
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()
+        excess = count[0] - self._max_entries
+        if excess > 0:
+            connection.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache '
+                'ORDER BY expires IS NULL, expires LIMIT ?)',
+                (excess,)
+            )
+
+    # L1
+
+    def _l1_get(self, key, now):
+        with self._l1_lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return None
+            data, expires, stamp, checked = entry
+            if expires is not None and expires <= now:
+                del self._l1[key]
+                return None
+            self._l1.move_to_end(key)
+            return entry
+
+    def _l1_set(self, key, data, expires, stamp, now):
+        with self._l1_lock:
+            self._l1[key] = (data, expires, stamp, now)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self._l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_delete(self, key):
+        with self._l1_lock:
+            self._l1.pop(key, None)
+
+    # API
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        entry = self._l1_get(key, now)
+        connection = self._connection()
+        if entry is not None:
+            data, expires, stamp, checked = entry
+            if now - checked < self._sync_interval:
+                return pickle.loads(data)
+            row = connection.execute(
+                'SELECT stamp FROM cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None and row[0] == stamp:
+                self._l1_set(key, data, expires, stamp, now)
+                return pickle.loads(data)
+            self._l1_delete(key)
+
+        row = connection.execute(
+            'SELECT value, expires, stamp FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return default
+        data, expires, stamp = row
+        if expires is not None and expires <= now:
+            return default
+        self._l1_set(key, data, expires, stamp, now)
+        return pickle.loads(data)
+
+    def get_many(self, keys, version=None):
+        """
+        Ключи, которых нет в L1 или которые пора сверить, читаются из L2
+        одним запросом на каждые BATCH_SIZE ключей.
+        """
+        now = time.time()
+        found = {}
+        stale = {}
+        for original in keys:
+            key = self.make_key(original, version=version)
+            self.validate_key(key)
+            entry = self._l1_get(key, now)
+            if entry is None:
+                stale[key] = (original, None)
+            elif now - entry[3] < self._sync_interval:
+                found[original] = pickle.loads(entry[0])
+            else:
+                stale[key] = (original, entry)
+
+        connection = self._connection()
+        pending = list(stale)
+        for start in range(0, len(pending), BATCH_SIZE):
+            batch = pending[start:start + BATCH_SIZE]
+            rows = connection.execute(
+                'SELECT key, value, expires, stamp FROM cache '
+                'WHERE key IN ({})'.format(', '.join('?' * len(batch))),
+                batch
+            ).fetchall()
+            for key, data, expires, stamp in rows:
+                if expires is not None and expires <= now:
+                    continue
+                original = stale.pop(key)[0]
+                self._l1_set(key, data, expires, stamp, now)
+                found[original] = pickle.loads(data)
+        for key, (original, entry) in stale.items():
+            if entry is not None:
+                self._l1_delete(key)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        expires = self.get_backend_timeout(timeout)
+        stamp = _new_stamp()
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        connection = self._connection()
+        connection.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires, stamp) '
+            'VALUES (?, ?, ?, ?)',
+            (key, data, expires, stamp)
+        )
+        self._cull(connection)
+        self._l1_set(key, data, expires, stamp, time.time())
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        expires = self.get_backend_timeout(timeout)
+        stamp = _new_stamp()
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, time.time())
+            )
+            added = connection.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires, stamp) '
+                'VALUES (?, ?, ?, ?)',
+                (key, data, expires, stamp)
+            ).rowcount == 1
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        if added:
+            self._l1_set(key, data, expires, stamp, time.time())
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        stamp = _new_stamp()
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT value, expires FROM cache WHERE key = ?', (key,)
+            ).fetchone()
+            expired = row is not None and row[1] is not None and (
+                row[1] <= time.time()
+            )
+            if row is None or expired:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            connection.execute(
+                'UPDATE cache SET value = ?, stamp = ? WHERE key = ?',
+                (data, stamp, key)
+            )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        self._l1_set(key, data, row[1], stamp, time.time())
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        expires = self.get_backend_timeout(timeout)
+        self._l1_delete(key)
+        return self._connection().execute(
+            'UPDATE cache SET expires = ?, stamp = ? WHERE key = ?',
+            (expires, _new_stamp(), key)
+        ).rowcount == 1
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._l1_delete(key)
+        self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version=version) is not self
+
+    def clear(self):
+        with self._l1_lock:
+            self._l1.clear()
+        self._connection().execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединения с L2 живут всё время работы потока.
+        pass
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.views.static import serve
+from sorl.thumbnail.conf import settings as sorl_settings
+
+from .storage import HASHED_NAME
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def serve_media(request, path, document_root=None, show_indexes=False):
+    """
+    Отдаёт файлы MEDIA_ROOT. Файлы с именем по содержимому и миниатюры
+    sorl, чьё имя зависит от имени исходника, кешируются навсегда.
+    """
+    response = serve(request, path, document_root, show_indexes)
+    if response.status_code in (200, 304):
+        immutable = HASHED_NAME.search(path) or path.startswith(
+            sorl_settings.THUMBNAIL_PREFIX
+        )
+        if immutable:
+            response['Cache-Control'] = IMMUTABLE
+        else:
+            response['Cache-Control'] = 'public, max-age={}'.format(
+                settings.MEDIA_CACHE_TIMEOUT
+            )
+    return response
@@ -0,0 +1,102 @@
+"""
+Чтение с реплик, запись в основную базу.
+
+Запросы на чтение уходят на случайную реплику из DATABASE_REPLICAS.
+После записи пользователь какое-то время читает из основной базы, чтобы
+увидеть свои изменения, пока реплика отстаёт: до конца запроса это
+помнит контекст запроса, который ставит и сбрасывает
+ReplicaPinMiddleware, а на REPLICA_PIN_SECONDS после него - cookie.
+Вне запроса запись ничего не закрепляет, для этого есть use_primary.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Состояние текущего запроса (primary, wrote) или None вне запроса.
+_request = ContextVar('replica_pin_request', default=None)
+_use_primary = ContextVar('replica_use_primary', default=False)
+
+
+def _pinned():
+    scope = _request.get()
+    return _use_primary.get() or (scope is not None and scope.primary)
+
+
+@contextmanager
+def use_primary():
+    """
+    Все чтения внутри блока идут в основную базу. Нужен фоновым
+    задачам, которые читают только что записанное.
+    """
+    token = _use_primary.set(True)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or _pinned():
+            return DEFAULT_DB_ALIAS
+        # Внутри транзакции читаем то, что в ней же записано.
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        scope = _request.get()
+        if scope is not None:
+            scope.primary = scope.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Основная база и реплики - одни и те же данные. Про другие
+        # базы решают другие роутеры или Django.
+        pool = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики - копии основной базы, схему в них не меняем.
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaPinMiddleware:
+    """
+    Держит запрос на основной базе, если он меняет данные или пришёл
+    с cookie недавней записи, и ставит cookie, если запрос что-то
+    записал.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        cookie = settings.REPLICA_PIN_COOKIE
+        scope = SimpleNamespace(
+            primary=(
+                request.method not in SAFE_METHODS or
+                cookie in request.COOKIES
+            ),
+            wrote=False,
+        )
+        token = _request.set(scope)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request.reset(token)
+        if scope.wrote:
+            response.set_cookie(
+                cookie, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,31 @@
+import copy
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Тесты работают с кешем во временном каталоге: cache.clear() в тестах
+    не трогает cache.sqlite3 разработчика, а тестовые записи удаляются
+    вместе с каталогом.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_directory = tempfile.mkdtemp()
+        caches = copy.deepcopy(settings.CACHES)
+        caches['default']['LOCATION'] = os.path.join(
+            self.cache_directory, 'cache.sqlite3'
+        )
+        self.cache_settings = override_settings(CACHES=caches)
+        self.cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_settings.disable()
+        shutil.rmtree(self.cache_directory, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -53,9 +53,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'yatube.routers.ReplicaPinMiddleware',
+    'posts.middleware.QueryBudgetMiddleware',
+    'posts.middleware.ThumbnailLookupMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
+    'users.middleware.RenamedBackendMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -93,13 +97,50 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# Бэкенд включает WAL и остальные PRAGMA из yatube/sqlite/base.py
+# (переопределяются в OPTIONS['pragmas']),
+# соединение живёт CONN_MAX_AGE секунд и переиспользуется запросами.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'yatube.sqlite',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 60,
     }
 }
 
+# Реплики только для чтения, см. yatube/routers.py: пути к копиям базы
+# через запятую в переменной окружения DATABASE_REPLICAS. Локально
+# копию обновляет команда sync_replicas.
+DATABASE_REPLICAS = []
+for number, path in enumerate(
+    filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), 1
+):
+    alias = 'replica{}'.format(number)
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        NAME=path,
+        OPTIONS={'pragmas': {'query_only': 1}},
+        TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['yatube.routers.PrimaryReplicaRouter']
+# Сколько секунд после записи пользователь читает из основной базы.
+REPLICA_PIN_SECONDS = 5
+REPLICA_PIN_COOKIE = 'primary'
+
+
+# Сессии читаются из кеша и сквозь него пишутся в базу. С переменной
+# окружения SESSION_SIGNED_COOKIES сессия целиком хранится в подписанной
+# cookie и не требует ни кеша, ни базы.
+if os.environ.get('SESSION_SIGNED_COOKIES'):
+    SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+else:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Пользователь запроса берётся из кеша, см. users/backends.py.
+AUTHENTICATION_BACKENDS = ['users.backends.CachedModelBackend']
+USER_CACHE_TIMEOUT = 60 * 60 * 24
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -142,12 +183,34 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Загрузки называются по sha256 содержимого, см. yatube/storage.py.
+# Миниатюры sorl называет сам, им нужно обычное хранилище.
+DEFAULT_FILE_STORAGE = 'yatube.storage.ContentAddressedStorage'
+THUMBNAIL_STORAGE = 'django.core.files.storage.FileSystemStorage'
+# Срок кеширования файлов MEDIA_ROOT, имя которых не зависит от
+# содержимого (например, DEFAULT_AVATAR).
+MEDIA_CACHE_TIMEOUT = 60 * 60
+# collect_media_garbage не трогает файлы моложе этого числа секунд:
+# их записи могут быть ещё не сохранены.
+MEDIA_GC_MIN_AGE = 60 * 60
 
 STATICFILES_FINDERS = (
     'django.contrib.staticfiles.finders.FileSystemFinder',
     'django.contrib.staticfiles.finders.AppDirectoriesFinder',
     'django.contrib.staticfiles.finders.DefaultStorageFinder',
 )
+
+# Загрузка изображений, см. posts/uploads.py. Файлы тяжелее
+# IMAGE_UPLOAD_MAX_SIZE байт или больше IMAGE_UPLOAD_MAX_PIXELS пикселей
+# отбрасываются, не дочитываясь, остальные уменьшаются до
+# IMAGE_MAX_DIMENSION по большей стороне. У анимаций ограничено ещё и
+# число пикселей во всех кадрах вместе.
+IMAGE_UPLOAD_MAX_SIZE = 20 * 2 ** 20
+IMAGE_UPLOAD_MAX_PIXELS = 50 * 10 ** 6
+IMAGE_UPLOAD_MAX_ANIMATION_PIXELS = 200 * 10 ** 6
+IMAGE_MAX_DIMENSION = 2560
+IMAGE_UPLOAD_QUALITY = 88
+
 # Login
 
 LOGIN_URL = "/auth/login/"
@@ -160,12 +223,85 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
 SITE_ID = 1
 
+# LRU в памяти процесса перед общим для процессов SQLite-файлом,
+# см. yatube/cache_backends.py.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'yatube.cache_backends.TieredCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'L1_MAX_ENTRIES': 1000,
+            'SYNC_INTERVAL': 1,
+        },
     }
 }
+# Тесты подменяют LOCATION временным файлом, см. yatube/runner.py.
+TEST_RUNNER = 'yatube.runner.TestRunner'
 
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
+
+# Posts
+
+POSTS_PER_PAGE = 10
+# Сколько секунд хранится отрисованная карточка записи.
+POST_CARD_TIMEOUT = 60 * 60 * 24
+# Главная страница сбрасывается при изменении записей,
+# INDEX_CACHE_TIMEOUT - предельный срок жизни на всякий случай.
+INDEX_CACHE_TIMEOUT = 60 * 5
+# Шапка профиля сбрасывается при смене фото, подписок и числа записей.
+PROFILE_HEADER_TIMEOUT = 60 * 60 * 24
+# Сколько секунд помнится id пользователя по имени из адреса и
+# отсутствие пользователя с таким именем, см. posts/lookups.py.
+USERNAME_CACHE_TIMEOUT = 60 * 60 * 24
+USERNAME_MISS_TIMEOUT = 60 * 5
+# Аватар по умолчанию, путь относительно MEDIA_ROOT.
+DEFAULT_AVATAR = 'profile.jpg'
+
+# Миниатюры строятся фоновым пулом сразу после загрузки, см.
+# posts/thumbnails.py. Шаблоны показывают только готовые варианты.
+THUMBNAIL_VARIANTS = {
+    'post': {
+        'size': (960, 339),
+        'options': {'crop': 'center', 'upscale': True},
+    },
+    'avatar': {
+        'size': (960, 960),
+        'options': {'crop': 'center', 'upscale': True},
+    },
+}
+# Ширины для srcset, каждая строится и в формате по умолчанию (JPEG),
+# и в THUMBNAIL_EXTRA_FORMATS, если Pillow их поддерживает.
+THUMBNAIL_WIDTHS = (320, 640, 960)
+THUMBNAIL_EXTRA_FORMATS = ('WEBP',)
+# Сколько первых карточек ленты грузят картинку сразу, остальные
+# получают loading="lazy".
+THUMBNAIL_EAGER_CARDS = 2
+# Прозрачная заглушка в static: пока миниатюра строится, под ней виден
+# средний цвет изображения.
+THUMBNAIL_PLACEHOLDER = 'posts/placeholder.svg'
+THUMBNAIL_WORKERS = 2
+
+# Подсказки имён и сообществ из индекса в памяти, см. posts/autocomplete.py.
+# Ранжируются первые AUTOCOMPLETE_SCAN_LIMIT совпадений по префиксу и
+# лучшие AUTOCOMPLETE_LIMIT ключей на его первые два символа; индекс
+# целиком перестраивается, а счёт обновляется раз в
+# AUTOCOMPLETE_REBUILD_INTERVAL.
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_SCAN_LIMIT = 1000
+AUTOCOMPLETE_REBUILD_INTERVAL = 10 * 60
+
+
+# Лента подписок: записи авторов, у которых подписчиков больше
+# TIMELINE_FANOUT_LIMIT, не раскладываются по лентам при создании.
+TIMELINE_FANOUT_LIMIT = 1000
+TIMELINE_BATCH_SIZE = 500
+# Сколько последних записей автора попадает в ленту при подписке.
+TIMELINE_BACKFILL_LIMIT = 200
+
+# Бюджет SQL-запросов на представление, см. posts.middleware.
+# QUERY_BUDGET_DEFAULT применяется к представлениям без @query_budget.
+QUERY_BUDGET_DEFAULT = None
+QUERY_BUDGET_RAISE = False
@@ -0,0 +1,39 @@
+"""
+Бэкенд SQLite, который настраивает каждое новое соединение.
+
+WAL позволяет читать, пока идёт запись, synchronous=NORMAL в режиме
+WAL не теряет целостность при сбое процесса, busy_timeout заставляет
+писателя подождать блокировку вместо немедленного "database is locked".
+Значения по умолчанию - PRAGMAS, их можно переопределить через
+OPTIONS['pragmas'] в DATABASES.
+"""
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    # Миллисекунды.
+    'busy_timeout': 5000,
+    # Байты, файл базы читается через отображение в память.
+    'mmap_size': 256 * 2 ** 20,
+    # Отрицательное значение - размер кеша страниц в КБ.
+    'cache_size': -32 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+def apply_pragmas(connection, pragmas):
+    for name, value in pragmas.items():
+        connection.execute('PRAGMA {} = {}'.format(name, value))
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = dict(PRAGMAS, **params.pop('pragmas', {}))
+        return params
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        apply_pragmas(connection, self.pragmas)
+        return connection
@@ -0,0 +1,68 @@
+"""
+Хранилище, которое называет файлы по sha256 их содержимого. Одинаковые
+файлы хранятся один раз, а файл под данным именем никогда не меняется,
+поэтому его можно кешировать навсегда.
+"""
+import hashlib
+import os
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+# Имя файла, выданное ContentAddressedStorage: <каталог>/ab/<sha256>.ext
+HASHED_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def hashed_name(self, name, content):
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        digest = content_hash(content)
+        return os.path.join(
+            directory, digest[:2], '{}{}'.format(digest, extension)
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if self.exists(name) and self._touch(name):
+            # Такой файл уже загружен: запись будет ссылаться на него.
+            return name
+        saved = super().save(name, content, max_length)
+        if saved != name and self._matches(name):
+            # Тот же файл параллельно сохранил другой запрос: копия с
+            # суффиксом не нужна.
+            self.delete(saved)
+            self._touch(name)
+            return name
+        return saved
+
+    def _touch(self, name):
+        # Свежая отметка времени не даёт collect_media_garbage удалить
+        # файл, на который только что сослалась новая запись.
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _matches(self, name):
+        # Файл может быть ещё недописан другим запросом: он совпадает,
+        # только если его содержимое даёт тот же sha256, что и в имени.
+        digest = os.path.splitext(os.path.basename(name))[0]
+        try:
+            with self.open(name) as file_:
+                return content_hash(file_) == digest
+        except FileNotFoundError:
+            return False
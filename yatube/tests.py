@@ -0,0 +1,222 @@
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from .cache_backends import TieredCache
+from .sqlite.base import DatabaseWrapper
+from .media import IMMUTABLE, serve_media
+from .routers import PrimaryReplicaRouter, ReplicaPinMiddleware, use_primary
+from .storage import ContentAddressedStorage
+
+
+class TestTieredCache(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.sqlite3')
+
+    def make_cache(self, **options):
+        return TieredCache(self.path, {'OPTIONS': options})
+
+    def test_values_are_copies(self):
+        cache = self.make_cache()
+        cache.set('key', {'a': 1})
+        cache.get('key')['a'] = 2
+        self.assertEqual(cache.get('key'), {'a': 1})
+        self.assertEqual(cache.get_many(['key']), {'key': {'a': 1}})
+
+    def test_tests_use_temporary_location(self):
+        location = settings.CACHES['default']['LOCATION']
+        self.assertNotEqual(os.path.dirname(location), settings.BASE_DIR)
+
+    def test_basic_operations(self):
+        cache = self.make_cache()
+        cache.set('key', {'a': 1})
+        self.assertEqual(cache.get('key'), {'a': 1})
+        self.assertFalse(cache.add('key', 2))
+        self.assertTrue(cache.add('other', 2))
+        self.assertEqual(cache.incr('other', 3), 5)
+        cache.delete('key')
+        self.assertIsNone(cache.get('key'))
+        cache.set('short', 1, 0.01)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('short'))
+        self.assertTrue(cache.add('short', 2))
+
+    def test_l1_is_bounded(self):
+        cache = self.make_cache(L1_MAX_ENTRIES=2)
+        for i in range(5):
+            cache.set('key%s' % i, i)
+        self.assertEqual(len(cache._l1), 2)
+        self.assertEqual(cache.get('key0'), 0)
+
+    def test_get_many(self):
+        first = self.make_cache(SYNC_INTERVAL=0.05)
+        second = self.make_cache(SYNC_INTERVAL=0.05)
+        first.set_many({'a': 1, 'b': 2})
+        self.assertEqual(second.get('a'), 1)
+        first.set('a', 10)
+        first.delete('b')
+        self.assertEqual(second.get_many(['a', 'c']), {'a': 1})
+        time.sleep(0.06)
+        self.assertEqual(second.get_many(['a', 'b', 'c']), {'a': 10})
+
+    def test_invalidation_reaches_other_process(self):
+        first = self.make_cache(SYNC_INTERVAL=0.05)
+        second = self.make_cache(SYNC_INTERVAL=0.05)
+        first.set('key', 'old')
+        self.assertEqual(second.get('key'), 'old')
+        first.set('key', 'new')
+        # До конца интервала второй процесс может отдавать копию из L1.
+        self.assertEqual(second.get('key'), 'old')
+        time.sleep(0.06)
+        self.assertEqual(second.get('key'), 'new')
+        first.delete('key')
+        time.sleep(0.06)
+        self.assertIsNone(second.get('key'))
+
+
+class TestContentAddressedStorage(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.storage = ContentAddressedStorage(location=self.root)
+
+    def test_dedupe(self):
+        first = self.storage.save('posts/a.JPG', ContentFile(b'same'))
+        second = self.storage.save('posts/b.jpg', ContentFile(b'same'))
+        other = self.storage.save('posts/c.jpg', ContentFile(b'other'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertRegex(first, r'^posts/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(len(os.listdir(os.path.dirname(
+            self.storage.path(first)
+        ))), 1)
+
+    def test_reuse_touches_file(self):
+        name = self.storage.save('posts/a.jpg', ContentFile(b'same'))
+        path = self.storage.path(name)
+        os.utime(path, (0, 0))
+        self.storage.save('posts/b.jpg', ContentFile(b'same'))
+        self.assertGreater(os.path.getmtime(path), time.time() - 60)
+
+    def test_concurrent_identical_upload(self):
+        name = self.storage.save('posts/a.jpg', ContentFile(b'same'))
+        exists = self.storage.exists
+        calls = []
+
+        def racing_exists(candidate):
+            # Первая проверка прошла до того, как другой запрос дописал
+            # файл.
+            calls.append(candidate)
+            return len(calls) > 1 and exists(candidate)
+
+        self.storage.exists = racing_exists
+        second = self.storage.save('posts/b.jpg', ContentFile(b'same'))
+        self.assertEqual(second, name)
+        self.assertEqual(len(os.listdir(os.path.dirname(
+            self.storage.path(name)
+        ))), 1)
+
+    def test_immutable_headers(self):
+        name = self.storage.save('posts/a.jpg', ContentFile(b'data'))
+        with open(os.path.join(self.root, 'plain.jpg'), 'wb') as file_:
+            file_.write(b'data')
+        request = RequestFactory().get('/media/')
+        response = serve_media(request, name, self.root)
+        self.assertEqual(response['Cache-Control'], IMMUTABLE)
+        response = serve_media(request, 'plain.jpg', self.root)
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+
+class TestSqliteBackend(SimpleTestCase):
+    def test_pragmas(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_dict = dict(
+            connection.settings_dict,
+            NAME=os.path.join(directory.name, 'db.sqlite3'),
+            OPTIONS={'pragmas': {'busy_timeout': 1000}},
+        )
+        wrapper = DatabaseWrapper(settings_dict, alias='pragmas')
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            values = [
+                cursor.execute('PRAGMA {}'.format(name)).fetchone()[0]
+                for name in ('journal_mode', 'synchronous', 'busy_timeout')
+            ]
+        self.assertEqual(values, ['wal', 1, 1000])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=5)
+class TestReplicaRouter(SimpleTestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def request(self, method='get', cookies=None, write=False):
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(None))
+            if write:
+                self.router.db_for_write(None)
+                seen.append(self.router.db_for_read(None))
+            return HttpResponse()
+
+        request = getattr(self.factory, method)('/')
+        request.COOKIES.update(cookies or {})
+        response = ReplicaPinMiddleware(view)(request)
+        return seen, response
+
+    def test_reads_go_to_replica(self):
+        seen, response = self.request()
+        self.assertEqual(seen, ['replica'])
+        self.assertNotIn('primary', response.cookies)
+        self.assertEqual(self.router.db_for_write(None), 'default')
+
+    def test_read_your_writes(self):
+        seen, response = self.request(write=True)
+        self.assertEqual(seen, ['replica', 'default'])
+        self.assertEqual(response.cookies['primary']['max-age'], 5)
+        seen, _ = self.request(cookies={'primary': '1'})
+        self.assertEqual(seen, ['default'])
+        # Поток не помнит запись после конца запроса.
+        seen, _ = self.request()
+        self.assertEqual(seen, ['replica'])
+
+    def test_write_outside_request(self):
+        self.assertEqual(self.router.db_for_write(None), 'default')
+        self.assertEqual(self.router.db_for_read(None), 'replica')
+
+    def test_allow_relation(self):
+        def instance(db):
+            return SimpleNamespace(_state=SimpleNamespace(db=db))
+
+        self.assertTrue(self.router.allow_relation(
+            instance('default'), instance('replica')
+        ))
+        self.assertIsNone(self.router.allow_relation(
+            instance('default'), instance('other')
+        ))
+
+    def test_unsafe_methods_use_primary(self):
+        seen, _ = self.request('post')
+        self.assertEqual(seen, ['default'])
+
+    def test_use_primary(self):
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(None), 'default')
+        self.assertEqual(self.router.db_for_read(None), 'replica')
+
+    def test_migrations_skip_replicas(self):
+        self.assertTrue(self.router.allow_migrate('default', 'posts'))
+        self.assertFalse(self.router.allow_migrate('replica', 'posts'))
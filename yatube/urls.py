@@ -20,6 +20,8 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.conf.urls import handler404, handler500
 
+from .media import serve_media
+
 
 handler404 = "posts.views.page_not_found"
 handler500 = "posts.views.server_error"
@@ -41,5 +43,7 @@ if settings.DEBUG:
     import debug_toolbar
 
     urlpatterns += (path("__debug__/", include(debug_toolbar.urls)),)
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    urlpatterns += static(
+        settings.MEDIA_URL, view=serve_media, document_root=settings.MEDIA_ROOT
+    )
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)